@@ -1,31 +1,294 @@
+import base64
+import bisect
+import glob
 import hashlib
+import itertools
 import json
+import multiprocessing
 import os
-from datetime import datetime
+import mmap
+import queue
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+except ImportError:  # only needed for proof-of-authority
+    Ed25519PrivateKey = None
+
+CHAIN_FILE = "blockchain.json"
+CHAIN_LOG_FILE = "blockchain.jsonl"
+CHAIN_BINARY_FILE = "blockchain.bin"
+DEFAULT_STORAGE = "json"  # "json" (whole file rewrite), "log" (append-only) or "binary"
+
+# Block formats. Version 0 hashes f"{index}{timestamp}{data}{previous_hash}{nonce}"
+# with str(data), which depends on dict key order; it is kept so existing
+# blocks still verify. Version 1 hashes canonical bytes (sorted keys, no
+# whitespace, UTF-8) that are computed once per block.
+# Version 2 blocks hold a list of records committed through a Merkle root;
+# the hash covers the header only, so mining cost is independent of batch size.
+# Version 3 has the version 2 layout (one record or a list of them) with
+# BLAKE2b-256 for the block hash and the Merkle tree. Each version keeps its
+# own hash, so older blocks validate under the rules they were written with.
+FORMAT_LEGACY = 0
+FORMAT_CANONICAL = 1
+FORMAT_MERKLE = 2
+FORMAT_BLAKE2B = 3
+MERKLE_FORMATS = (FORMAT_MERKLE, FORMAT_BLAKE2B)
+HASH_ALGORITHMS = {
+    FORMAT_LEGACY: "sha256",
+    FORMAT_CANONICAL: "sha256",
+    FORMAT_MERKLE: "sha256",
+    FORMAT_BLAKE2B: "blake2b",
+}
+BLOCK_FORMAT = FORMAT_CANONICAL  # format used for newly created blocks
+BATCH_FORMAT = FORMAT_MERKLE  # format for add_records(); must be one of MERKLE_FORMATS
+
+# Durability of appended blocks: "fsync" flushes to disk on every append,
+# "group" lets appends arriving within GROUP_COMMIT_WINDOW seconds share one
+# fsync, "buffered" leaves flushing to the OS.
+DURABILITY_MODES = ("fsync", "group", "buffered")
+DEFAULT_DURABILITY = "fsync"
+GROUP_COMMIT_WINDOW = 0.005
+
+SNAPSHOT_INTERVAL = 1000  # minimum blocks between automatic index snapshots
+# ... and at least this fraction of the chain, so snapshots of a growing
+# chain cost linear time in total rather than quadratic
+SNAPSHOT_GROWTH = 0.1
+SNAPSHOT_KEEP = 2  # newest snapshot files kept per ledger
+SNAPSHOT_FORMAT = 2
+
+BODY_CACHE_SIZE = 1024  # decoded block bodies kept per lazily loaded chain
+PROOF_MAX_HEADERS = 1000  # longest header path get_record_proof() returns
+
+DEFAULT_DIFFICULTY = 2  # proof-of-work target of new blocks (leading zero hex digits)
+# Lowest target a block may record, and the one assumed for blocks that
+# don't record theirs (every block before they did was mined at 2)
+MIN_DIFFICULTY = 2
+
+
+def available_cpus():
+    # CPUs this process may run on (its affinity mask), not the host total
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+MINING_WORKERS = available_cpus()
+# Mining workers start from a fresh interpreter: commits mine on request and
+# queue threads, and forking a threaded process can copy held locks
+MINING_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+# Measured at ~1.2M SHA-256 nonces/s per core: difficulty 3 takes ~3 ms
+# serially, less than one 20000-nonce check interval (~16 ms) that each worker
+# keeps burning after a winner; difficulty 4 takes ~55 ms against ~0.2 ms to
+# hand a job to the warm pool. Starting the pool (~1 s per worker when it
+# re-imports the app) is paid once per process.
+PARALLEL_MINING_MIN_DIFFICULTY = 4
+MINING_CHECK_INTERVAL = 20000  # nonces a worker tries between checks for a winner
+
+# How new blocks are sealed: "pow" mines a nonce, "poa" signs the block with
+# this node's key (see ProofOfAuthority)
+DEFAULT_CONSENSUS = "pow"
+NODE_KEY_FILE = "node.key"
+TRUSTED_AUTHORITIES = []  # hex public keys of other nodes whose blocks we accept
 
 # --- Blockchain Classes ---
 
+# Record fields whose values repeat across the ledger; their strings are
+# interned on load so a million records share one copy of each value.
+INTERNED_FIELDS = {"Patient Name", "patient ID", "File Type", "Disease", "File Status", "Uploaded By"}
+FACET_FIELDS = ("File Type", "Disease", "File Status", "Uploaded By")  # fields records can be filtered on
+
+
+def intern_record(record):
+    # json object_hook: share key strings and repeated field values
+    return {
+        sys.intern(key): sys.intern(value) if key in INTERNED_FIELDS and isinstance(value, str) else value
+        for key, value in record.items()
+    }
+
+
+def loads_record(raw):
+    return json.loads(raw, object_hook=intern_record)
+
+
+def canonical_bytes(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def new_hash(algorithm, data=b""):
+    # every algorithm yields a 32-byte digest, so hashes fit the same layouts
+    if algorithm == "blake2b":
+        return hashlib.blake2b(data, digest_size=32)
+    return hashlib.sha256(data)
+
+
+# --- Merkle tree over block records ---
+# Leaves and inner nodes are domain-separated; an unpaired node at the end
+# of a level is carried up unchanged.
+
+def merkle_leaf(record, algorithm="sha256"):
+    return new_hash(algorithm, b"\x00" + canonical_bytes(record)).digest()
+
+
+def merkle_parent(left, right, algorithm="sha256"):
+    return new_hash(algorithm, b"\x01" + left + right).digest()
+
+
+def compute_merkle_root(records, algorithm="sha256"):
+    level = [merkle_leaf(record, algorithm) for record in records]
+    if not level:
+        return new_hash(algorithm).hexdigest()
+    while len(level) > 1:
+        paired = [merkle_parent(level[i], level[i + 1], algorithm) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0].hex()
+
+
+def merkle_proof(records, leaf_index, algorithm="sha256"):
+    # Sibling hashes from leaf to root as [hash, side] pairs, where side says
+    # whether the sibling sits to the "left" or "right" of our node
+    level = [merkle_leaf(record, algorithm) for record in records]
+    path = []
+    pos = leaf_index
+    while len(level) > 1:
+        sibling = pos ^ 1
+        if sibling < len(level):
+            path.append([level[sibling].hex(), "left" if sibling < pos else "right"])
+        paired = [merkle_parent(level[i], level[i + 1], algorithm) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+        pos //= 2
+    return path
+
+
+def verify_merkle_proof(record, path, root, algorithm="sha256"):
+    node = merkle_leaf(record, algorithm)
+    for sibling, side in path:
+        sibling = bytes.fromhex(sibling)
+        node = merkle_parent(sibling, node, algorithm) if side == "left" else merkle_parent(node, sibling, algorithm)
+    return node.hex() == root
+
+
 class Block:
-    def __init__(self, index, previous_hash, data, timestamp=None, nonce=0, hash=None):
+    __slots__ = ("index", "timestamp", "data", "previous_hash", "nonce", "version",
+                 "merkle_root", "hash", "seal", "difficulty", "_data_bytes", "_prefix")
+
+    def __init__(self, index, previous_hash, data, timestamp=None, nonce=0, hash=None, version=None, merkle_root=None,
+                 seal=None, difficulty=None):
         self.index = index
         self.timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.data = data  # now just CID and metadata
+        self.data = data  # now just CID and metadata; treated as immutable once in a block
         self.previous_hash = previous_hash
         self.nonce = nonce
+        self.version = BLOCK_FORMAT if version is None else version
+        self.merkle_root = merkle_root
+        if self.version in MERKLE_FORMATS and merkle_root is None:
+            self.merkle_root = compute_merkle_root(self.records(), self.hash_algorithm())
+        self.seal = seal  # {"signer", "signature"} for proof-of-authority blocks
+        # proof-of-work target the block was mined at; part of the hashed
+        # header (legacy blocks can't carry it)
+        self.difficulty = None if self.version == FORMAT_LEGACY else difficulty
+        self._data_bytes = None
+        self._prefix = None
         self.hash = hash or self.calculate_hash()
 
+    def records(self):
+        # the patient records stored in this block, whatever its format
+        if isinstance(self.data, list) and self.version in MERKLE_FORMATS:
+            return self.data
+        return [self.data] if isinstance(self.data, dict) else []
+
+    def hash_algorithm(self):
+        if self.version not in HASH_ALGORITHMS:
+            raise ValueError(f"Unsupported block format version: {self.version}")
+        return HASH_ALGORITHMS[self.version]
+
+    def data_bytes(self):
+        # Serialized once and reused for hashing and persistence. Legacy
+        # blocks keep their key order so str(data) is unchanged on reload.
+        if self._data_bytes is None:
+            if self.version == FORMAT_LEGACY:
+                self._data_bytes = json.dumps(self.data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            else:
+                self._data_bytes = canonical_bytes(self.data)
+        return self._data_bytes
+
+    def hash_prefix(self):
+        # everything the hash covers except the nonce
+        if self._prefix is None:
+            if self.version == FORMAT_LEGACY:
+                self._prefix = f"{self.index}{self.timestamp}{self.data}{self.previous_hash}".encode()
+            elif self.version == FORMAT_CANONICAL:
+                header = canonical_bytes([self.version, self.index, self.timestamp, self.previous_hash,
+                                          *self._difficulty_field()])
+                self._prefix = header + b"\n" + self.data_bytes() + b"\n"
+            elif self.version in MERKLE_FORMATS:
+                header = canonical_bytes([self.version, self.index, self.timestamp, self.previous_hash, self.merkle_root,
+                                          *self._difficulty_field()])
+                self._prefix = header + b"\n"
+            else:
+                raise ValueError(f"Unsupported block format version: {self.version}")
+        return self._prefix
+
+    def _difficulty_field(self):
+        # blocks from before the difficulty was recorded keep their old preimage
+        return [] if self.difficulty is None else [self.difficulty]
+
+    def required_difficulty(self):
+        return MIN_DIFFICULTY if self.difficulty is None else self.difficulty
+
     def calculate_hash(self):
-        block_string = f"{self.index}{self.timestamp}{self.data}{self.previous_hash}{self.nonce}"
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        return new_hash(self.hash_algorithm(), self.hash_prefix() + str(self.nonce).encode()).hexdigest()
 
-    def mine_block(self, difficulty):
+    def mine_block(self, difficulty, workers=1):
         target = '0' * difficulty
-        while self.hash[:difficulty] != target:
-            self.nonce += 1
-            self.hash = self.calculate_hash()
+        if self.hash[:difficulty] == target:
+            return
+        if workers > 1:
+            self.nonce, self.hash = mine_parallel(self.hash_prefix(), difficulty, workers, start=self.nonce,
+                                                  algorithm=self.hash_algorithm())
+        else:
+            self.nonce, self.hash = search_nonce(self.hash_prefix(), difficulty, self.nonce + 1,
+                                                 algorithm=self.hash_algorithm())
+
+    def header_dict(self):
+        header = {
+            "index": self.index,
+            "timestamp": self.timestamp,
+            "previous_hash": self.previous_hash,
+            "nonce": self.nonce,
+            "hash": self.hash
+        }
+        if self.version != FORMAT_LEGACY:
+            header["version"] = self.version
+        if self.merkle_root is not None:
+            header["merkle_root"] = self.merkle_root
+        if self.seal is not None:
+            header["seal"] = self.seal
+        if self.difficulty is not None:
+            header["difficulty"] = self.difficulty
+        return header
 
     def to_dict(self):
-        return {
+        block = {
             "index": self.index,
             "timestamp": self.timestamp,
             "data": self.data,
@@ -33,6 +296,28 @@ class Block:
             "nonce": self.nonce,
             "hash": self.hash
         }
+        if self.version != FORMAT_LEGACY:
+            block["version"] = self.version
+        if self.merkle_root is not None:
+            block["merkle_root"] = self.merkle_root
+        if self.seal is not None:
+            block["seal"] = self.seal
+        if self.difficulty is not None:
+            block["difficulty"] = self.difficulty
+        return block
+
+    def encode_record(self):
+        # Compact JSON record that splices in the cached data bytes
+        header = json.dumps(self.header_dict(), separators=(",", ":")).encode("utf-8")
+        return header[:-1] + b',"data":' + self.data_bytes() + b"}"
+
+    def proof_header(self):
+        # Enough to recompute the hash: Merkle blocks commit to their records
+        # through the root, older formats need their (single-record) data
+        header = self.header_dict()
+        if self.version not in MERKLE_FORMATS:
+            header["data"] = self.data
+        return header
 
     @staticmethod
     def from_dict(data):
@@ -42,44 +327,1814 @@ class Block:
             data=data["data"],
             previous_hash=data["previous_hash"],
             nonce=data["nonce"],
-            hash=data["hash"]
+            hash=data["hash"],
+            version=data.get("version", FORMAT_LEGACY),
+            merkle_root=data.get("merkle_root"),
+            seal=data.get("seal"),
+            difficulty=data.get("difficulty")
         )
 
 
-class Blockchain:
+class LazyBlock(Block):
+    # Header fields live on the object; `data` is decoded from the store on
+    # first access and held only in the store's bounded body cache.
+    __slots__ = ("_store", "_position")
+
+    def __init__(self, store, position, index, timestamp, previous_hash, nonce, hash,
+                 version=FORMAT_LEGACY, merkle_root=None, seal=None, difficulty=None):
+        self.index = index
+        self.timestamp = timestamp
+        self.previous_hash = previous_hash
+        self.nonce = nonce
+        self.version = version
+        self.merkle_root = merkle_root
+        self.hash = hash
+        self.seal = seal
+        self.difficulty = difficulty
+        self._store = store
+        self._position = position
+        self._data_bytes = None
+        self._prefix = None
+
+    @property
+    def data(self):
+        return self._store.read_body(self._position)
+
+    def data_bytes(self):
+        return self._store.read_body_bytes(self._position)
+
+    def hash_prefix(self):
+        # not cached: for canonical blocks the prefix embeds the body
+        prefix = Block.hash_prefix(self)
+        self._prefix = None
+        return prefix
+
+
+# --- Columnar chain ---
+# Header fields of a lazily loaded chain live in flat arrays instead of one
+# object per block: raw 32-byte hashes and Merkle roots, epoch-second
+# timestamps and packed nonces/versions (~90 bytes per block). previous_hash
+# is not stored when it equals the prior block's hash. Anything that does
+# not fit (odd timestamps, non-hex hashes such as the genesis "0") goes to
+# small overflow dicts. Blocks are materialized as LazyBlock on access.
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def timestamp_epoch(timestamp):
+    # "YYYY-MM-DD HH:MM:SS[.ffffff]" (or a datetime) -> epoch seconds, None if it doesn't parse
+    try:
+        if not isinstance(timestamp, datetime):
+            timestamp = datetime.fromisoformat(timestamp.split(".")[0])
+        return (timestamp - _EPOCH) // timedelta(seconds=1)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class BlockColumns(Sequence):
+    def __init__(self, store):
+        self.store = store
+        self.hashes = bytearray()
+        self.roots = bytearray()
+        self.timestamps = array("q")
+        self.nonces = array("Q")
+        self.versions = array("B")
+        self.overflow = {}  # (field, position) -> original value
+        self.seals = {}  # position -> seal of proof-of-authority blocks
+        self.difficulties = array("b")  # -1 where the block records none
+        self.held = {}  # position -> Block appended here and not yet written to the store
+
+    def __len__(self):
+        return len(self.versions)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("block position out of range")
+        if position in self.held:
+            return self.held[position]
+        return LazyBlock(
+            self.store, position,
+            index=self.overflow.get(("index", position), position),
+            timestamp=self._timestamp(position),
+            previous_hash=self._previous_hash(position),
+            nonce=self.nonces[position],
+            hash=self._hash(position),
+            version=self.versions[position],
+            merkle_root=self._root(position),
+            seal=self.seals.get(position),
+            difficulty=None if self.difficulties[position] < 0 else self.difficulties[position]
+        )
+
+    def _hash(self, position):
+        if ("hash", position) in self.overflow:
+            return self.overflow[("hash", position)]
+        return self.hashes[position * 32:(position + 1) * 32].hex()
+
+    def _previous_hash(self, position):
+        if ("previous_hash", position) in self.overflow:
+            return self.overflow[("previous_hash", position)]
+        return self._hash(position - 1)
+
+    def _root(self, position):
+        if self.versions[position] not in MERKLE_FORMATS:
+            return None
+        return self.overflow.get(("merkle_root", position)) or self.roots[position * 32:(position + 1) * 32].hex()
+
+    def _timestamp(self, position):
+        if ("timestamp", position) in self.overflow:
+            return self.overflow[("timestamp", position)]
+        return str(_EPOCH + timedelta(seconds=self.timestamps[position]))
+
+    @staticmethod
+    def _raw_hash(value):
+        if isinstance(value, str) and len(value) == 64:
+            try:
+                return bytes.fromhex(value)
+            except ValueError:
+                pass
+        return None
+
+    def append_header(self, index, timestamp, previous_hash, nonce, hash, version=FORMAT_LEGACY, merkle_root=None,
+                      seal=None, difficulty=None):
+        position = len(self)
+        if index != position:
+            self.overflow[("index", position)] = index
+
+        raw = self._raw_hash(hash)
+        if raw is None:
+            self.overflow[("hash", position)] = hash
+        self.hashes += raw or bytes(32)
+
+        if position == 0 or previous_hash != self._hash(position - 1):
+            self.overflow[("previous_hash", position)] = previous_hash
+
+        raw = self._raw_hash(merkle_root)
+        if merkle_root is not None and raw is None:
+            self.overflow[("merkle_root", position)] = merkle_root
+        self.roots += raw or bytes(32)
+
+        # only "YYYY-MM-DD HH:MM:SS" round-trips through epoch seconds
+        seconds = 0
+        if len(timestamp) == 19 and timestamp[10] == " ":
+            try:
+                seconds = (datetime.fromisoformat(timestamp) - _EPOCH) // timedelta(seconds=1)
+            except ValueError:
+                self.overflow[("timestamp", position)] = timestamp
+        else:
+            self.overflow[("timestamp", position)] = timestamp
+        self.timestamps.append(seconds)
+
+        if seal is not None:
+            self.seals[position] = seal
+        self.difficulties.append(-1 if difficulty is None else difficulty)
+        self.nonces.append(nonce)
+        self.versions.append(version)
+
+    def append(self, block):
+        self.append_header(block.index, block.timestamp, block.previous_hash, block.nonce,
+                           block.hash, block.version, block.merkle_root, block.seal, block.difficulty)
+        self.held[len(self) - 1] = block
+
+    def extend(self, blocks):
+        for block in blocks:
+            self.append(block)
+
+    def release(self):
+        # The store has written the held blocks: from now on they are read
+        # back through its offset table like every other block
+        self.held.clear()
+
+    def extend_headers(self, headers):
+        for header in headers:
+            self.append_header(
+                header["index"], header["timestamp"], header["previous_hash"], header["nonce"],
+                header["hash"], header.get("version", FORMAT_LEGACY), header.get("merkle_root"),
+                header.get("seal"), header.get("difficulty")
+            )
+
+    # Snapshots keep the first `count` headers so a restart can skip the
+    # header scan: fixed-width columns as base64 of their native-endian
+    # bytes, the sparse maps as [position, ...] lists
+
+    def to_state(self, count):
+        return {
+            "byteorder": sys.byteorder,
+            "hashes": base64.b64encode(self.hashes[:count * 32]).decode(),
+            "roots": base64.b64encode(self.roots[:count * 32]).decode(),
+            "timestamps": base64.b64encode(self.timestamps[:count].tobytes()).decode(),
+            "nonces": base64.b64encode(self.nonces[:count].tobytes()).decode(),
+            "versions": base64.b64encode(self.versions[:count].tobytes()).decode(),
+            "difficulties": base64.b64encode(self.difficulties[:count].tobytes()).decode(),
+            "overflow": [[field, position, value] for (field, position), value in self.overflow.items()
+                         if position < count],
+            "seals": [[position, seal] for position, seal in self.seals.items() if position < count],
+        }
+
+    def load_state(self, state):
+        if state["byteorder"] != sys.byteorder:
+            raise ValueError("snapshot columns were written on another byte order")
+        self.hashes = bytearray(base64.b64decode(state["hashes"]))
+        self.roots = bytearray(base64.b64decode(state["roots"]))
+        for name, typecode in (("timestamps", "q"), ("nonces", "Q"), ("versions", "B"), ("difficulties", "b")):
+            column = array(typecode)
+            column.frombytes(base64.b64decode(state[name]))
+            setattr(self, name, column)
+        self.overflow = {(field, position): value for field, position, value in state["overflow"]}
+        self.seals = {position: seal for position, seal in state["seals"]}
+        self.held = {}
+        count = len(self.versions)
+        if len(self.hashes) != count * 32 or len(self.roots) != count * 32 or \
+                not len(self.timestamps) == len(self.nonces) == len(self.difficulties) == count:
+            raise ValueError("snapshot columns have different lengths")
+
+
+# --- Validation ---
+
+def pow_problem(block, min_difficulty=MIN_DIFFICULTY):
+    # Each block is held to the target it was mined at, so raising the
+    # difficulty doesn't invalidate older blocks; targets below
+    # min_difficulty are refused so cheap blocks can't be forged
+    difficulty = block.required_difficulty()
+    if difficulty < min_difficulty:
+        return f"difficulty {difficulty} is below the minimum of {min_difficulty}"
+    if not block.hash.startswith('0' * difficulty):
+        return "hash does not meet the proof-of-work target"
+    return None
+
+
+def block_problem(block, position, previous_hash, min_difficulty=MIN_DIFFICULTY):
+    # Why `block` does not belong at `position` after a block hashed
+    # previous_hash, or None if it does. The genesis block is not mined.
+    # Sealed (proof-of-authority) blocks skip the proof-of-work target;
+    # their signatures are checked separately with seal_problem().
+    if block.index != position:
+        return f"index {block.index} at position {position}"
+    if position and block.previous_hash != previous_hash:
+        return "previous_hash does not match the prior block"
+    if block.version in MERKLE_FORMATS and \
+            block.merkle_root != compute_merkle_root(block.records(), block.hash_algorithm()):
+        return "Merkle root does not match the block records"
+    if block.hash != block.calculate_hash():
+        return "hash does not match the block contents"
+    if position and block.seal is None:
+        return pow_problem(block, min_difficulty)
+    return None
+
+
+# The last verified height and its hash are kept next to the ledger so
+# routine checks and audits only re-verify newer blocks.
+
+def checkpoint_path(ledger_path):
+    return ledger_path + ".checkpoint"
+
+
+def read_checkpoint(ledger_path):
+    try:
+        with open(checkpoint_path(ledger_path), "r") as f:
+            checkpoint = json.load(f)
+        return int(checkpoint["height"]), checkpoint["hash"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def write_checkpoint(ledger_path, height, block_hash):
+    tmp_path = checkpoint_path(ledger_path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"height": height, "hash": block_hash,
+                   "verified_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}, f)
+    os.replace(tmp_path, checkpoint_path(ledger_path))
+
+
+# --- Record inclusion proofs ---
+
+def verify_record_proof(proof, trusted_hash=None, min_difficulty=MIN_DIFFICULTY, authorities=None):
+    # Checks that proof["record"] is committed in the first header and that
+    # the headers link up to trusted_hash (when given). The Merkle part costs
+    # O(log records in block); no other block bodies are needed. Each
+    # unsealed header must meet its own PoW target; sealed headers are
+    # checked against `authorities` instead, and without `authorities` a
+    # sealed header can't be checked, so it fails.
+    headers = proof.get("headers") or []
+    if not headers:
+        return False
+    record = proof["record"]
+    first = headers[0]
+    version = first.get("version", FORMAT_LEGACY)
+    if version in MERKLE_FORMATS:
+        if not verify_merkle_proof(record, proof.get("path", []), first.get("merkle_root"), HASH_ALGORITHMS[version]):
+            return False
+    elif canonical_bytes(first.get("data")) != canonical_bytes(record):
+        return False
+
+    for position, header in enumerate(headers):
+        block = Block.from_dict(dict(header, data=header.get("data"), hash=None))
+        if block.hash != header["hash"]:
+            return False
+        if block.seal is None and pow_problem(block, min_difficulty):
+            return False
+        if block.seal is not None and (authorities is None or seal_problem(block, authorities)):
+            return False
+        if position and header["previous_hash"] != headers[position - 1]["hash"]:
+            return False
+    return trusted_hash is None or headers[-1]["hash"] == trusted_hash
+
+
+# --- Proof-of-work ---
+# Only the trailing nonce changes between attempts, so the prefix is hashed
+# once and each attempt resumes from a copy of that hash state. The digest
+# is byte-for-byte the one Block.calculate_hash produces.
+
+def search_nonce(prefix, difficulty, start=0, step=1, stop=None, algorithm="sha256"):
+    # Returns (nonce, hash) for the first match, or None if `stop` is reached
+    target = '0' * difficulty
+    midstate = new_hash(algorithm, prefix)
+    for nonce in itertools.count(start, step) if stop is None else range(start, stop, step):
+        attempt = midstate.copy()
+        attempt.update(str(nonce).encode())
+        block_hash = attempt.hexdigest()
+        if block_hash[:difficulty] == target:
+            return nonce, block_hash
+    return None
+
+
+# Parallel search
+# Worker i tries nonces start+i, start+i+W, start+i+2W, ... so the pool
+# covers the nonce space without overlap. The workers are started once per
+# process and reused: a fresh forkserver/spawn worker re-imports the app,
+# which costs far more than the search itself at moderate difficulty. Each
+# block is a numbered job; workers search while `current` holds their job's
+# number, so the first result (or the next job) stops the rest at their
+# next check.
+
+def _mine_worker(jobs, current, results):
+    while True:
+        job, prefix, difficulty, nonce, step, algorithm = jobs.get()
+        while current.value == job:
+            stop = nonce + step * MINING_CHECK_INTERVAL
+            result = search_nonce(prefix, difficulty, nonce, step, stop, algorithm)
+            if result:
+                results.put((job, *result))
+                break
+            nonce = stop
+
+
+class MiningPool:
+    def __init__(self, workers):
+        ctx = multiprocessing.get_context(MINING_START_METHOD)
+        self.workers = workers
+        self.current = ctx.RawValue("Q", 0)  # job being mined, 0 when idle
+        self.results = ctx.Queue()
+        self.jobs = [ctx.Queue() for _ in range(workers)]
+        self.procs = [
+            ctx.Process(target=_mine_worker, args=(jobs, self.current, self.results), daemon=True)
+            for jobs in self.jobs
+        ]
+        for proc in self.procs:
+            proc.start()
+        self.job = 0
+
+    def alive(self):
+        return all(proc.is_alive() for proc in self.procs)
+
+    def mine(self, prefix, difficulty, start=0, algorithm="sha256"):
+        self.job += 1
+        self.current.value = self.job
+        for i, jobs in enumerate(self.jobs):
+            jobs.put((self.job, prefix, difficulty, start + i, self.workers, algorithm))
+        try:
+            while True:
+                try:
+                    job, nonce, block_hash = self.results.get(timeout=1)
+                except queue.Empty:
+                    if not self.alive():
+                        raise RuntimeError("A mining worker exited")
+                    continue
+                if job == self.job:  # not a late result of an earlier job
+                    return nonce, block_hash
+        finally:
+            self.current.value = 0
+
+    def close(self):
+        self.current.value = 0
+        for proc in self.procs:
+            proc.terminate()
+
+
+_mining_pool = None
+_mining_pool_lock = threading.Lock()  # one block mined through the pool at a time
+
+
+def mine_parallel(prefix, difficulty, workers, start=0, algorithm="sha256"):
+    global _mining_pool
+    with _mining_pool_lock:
+        if _mining_pool is None or _mining_pool.workers != workers or not _mining_pool.alive():
+            if _mining_pool is not None:
+                _mining_pool.close()
+            _mining_pool = MiningPool(workers)
+        return _mining_pool.mine(prefix, difficulty, start, algorithm)
+
+
+# --- Consensus ---
+# A sealer finishes each new block before it is appended and judges the
+# seals of loaded blocks. ProofOfWork mines a nonce as before; with
+# ProofOfAuthority the node signs the block hash with its Ed25519 key, so
+# sealing costs one signature whatever the difficulty.
+
+class ProofOfWork:
+    name = "pow"
+    authorities = frozenset()
+
+    def block_difficulty(self, chain):
+        # recorded in each new block's header
+        return chain.difficulty
+
+    def seal(self, block, chain):
+        difficulty = chain.difficulty if block.difficulty is None else block.difficulty
+        block.mine_block(difficulty, chain.mining_workers())
+
+    def check_seals(self, sealed):
+        # a proof-of-work node trusts no signer
+        return sealed[0][0] if sealed else None
+
+
+def load_node_key(path=NODE_KEY_FILE):
+    # This node's Ed25519 private key; created (owner-readable only) on first use
+    if Ed25519PrivateKey is None:
+        raise RuntimeError("Proof-of-authority needs the 'cryptography' package (pip install cryptography)")
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, "r") as f:
+            return Ed25519PrivateKey.from_private_bytes(bytes.fromhex(f.read().strip()))
+    key = Ed25519PrivateKey.generate()
+    raw = key.private_bytes(serialization.Encoding.Raw, serialization.PrivateFormat.Raw,
+                            serialization.NoEncryption())
+    with os.fdopen(fd, "w") as f:
+        f.write(raw.hex() + "\n")
+    print(f"🔑 Created node key {path}.")
+    return key
+
+
+def public_key_hex(key):
+    return key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw).hex()
+
+
+_public_keys = {}  # signer hex -> Ed25519PublicKey, shared by every check
+
+
+def seal_problem(block, authorities):
+    # Why the block's authority seal is unacceptable, or None if it is valid
+    if Ed25519PrivateKey is None:
+        raise RuntimeError("Checking proof-of-authority seals needs the 'cryptography' package")
+    seal = block.seal
+    if not isinstance(seal, dict) or seal.get("signer") not in authorities:
+        return "sealed by an untrusted signer"
+    try:
+        key = _public_keys.get(seal["signer"])
+        if key is None:
+            key = _public_keys[seal["signer"]] = Ed25519PublicKey.from_public_bytes(bytes.fromhex(seal["signer"]))
+        key.verify(bytes.fromhex(seal["signature"]), block.hash.encode())
+    except (InvalidSignature, ValueError, KeyError, TypeError):
+        return "authority signature does not match the block hash"
+    return None
+
+
+class ProofOfAuthority:
+    # Seals are accepted from this node's key and from `authorities` (hex
+    # public keys); share public_key_hex(load_node_key()) with other nodes.
+    name = "poa"
+
+    def __init__(self, key_path=NODE_KEY_FILE, authorities=None):
+        self.key = load_node_key(key_path)
+        self.signer = public_key_hex(self.key)
+        self.authorities = frozenset([self.signer, *(TRUSTED_AUTHORITIES if authorities is None else authorities)])
+
+    def block_difficulty(self, chain):
+        return None  # nothing is mined
+
+    def seal(self, block, chain):
+        block.seal = {"signer": self.signer, "signature": self.key.sign(block.hash.encode()).hex()}
+
+    def check_seals(self, sealed):
+        # [(position, block)] -> position of the first bad seal, or None
+        for position, block in sealed:
+            if seal_problem(block, self.authorities):
+                return position
+        return None
+
+
+CONSENSUS = {
+    "pow": ProofOfWork,
+    "poa": ProofOfAuthority,
+}
+
+
+# --- Storage backends ---
+# Every store serializes writers across processes with FileLock. Readers
+# never take the lock: the JSON and full-rewrite paths replace the file
+# atomically, and appends are only read up to the last complete record.
+
+class FileLock:
+    # Exclusive cross-process lock held on "<path>.lock"
+    def __init__(self, path):
+        self.path = path + ".lock"
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+b")
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ~10s; keep waiting
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+class GroupCommit:
+    # Writers note each write, then wait for it to become durable. The first
+    # waiter becomes the leader: it sleeps for the window, fsyncs once and
+    # wakes every writer whose data that fsync covered.
+    def __init__(self, window):
+        self.window = window
+        self.cond = threading.Condition()
+        self.written = 0
+        self.synced = 0
+        self.leader = False
+
+    def note_write(self):
+        with self.cond:
+            self.written += 1
+            return self.written
+
+    def wait(self, ticket, fsync):
+        with self.cond:
+            while self.synced < ticket:
+                if self.leader:
+                    self.cond.wait()
+                    continue
+                self.leader = True
+                self.cond.release()
+                try:
+                    time.sleep(self.window)
+                    with self.cond:
+                        target = self.written
+                    fsync()
+                finally:
+                    self.cond.acquire()
+                    self.leader = False
+                    self.cond.notify_all()
+                self.synced = max(self.synced, target)
+
+
+class AppendFile:
+    # Shared by the append-only stores: a long-lived append handle and the
+    # configured durability for appends
+    def _init_append(self, durability):
+        durability = durability or DEFAULT_DURABILITY
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.durability = durability
+        self.group = GroupCommit(GROUP_COMMIT_WINDOW) if durability == "group" else None
+        self._handle = None
+        self._handle_inode = None
+
+    def _append_handle(self):
+        if self._handle is None or self._handle_inode != self.inode:
+            self._close_handle()
+            self._handle = open(self.path, "r+b")
+            self._handle_inode = self.inode
+        return self._handle
+
+    def _close_handle(self):
+        if self._handle is not None:
+            if self.group:
+                os.fsync(self._handle.fileno())  # don't strand grouped writes
+            self._handle.close()
+            self._handle = None
+
+    def _finish_append(self, f):
+        # Returns a ticket for wait_durable(), or None if already settled
+        f.flush()
+        if self.durability == "fsync":
+            os.fsync(f.fileno())
+        elif self.durability == "group":
+            return self.group.note_write()
+        return None
+
+    def _fsync_handle(self):
+        if self._handle is not None:
+            os.fsync(self._handle.fileno())
+
+    def wait_durable(self, ticket):
+        if ticket is not None:
+            self.group.wait(ticket, self._fsync_handle)
+
+    def _sync_new_file(self, f):
+        if self.durability != "buffered":
+            os.fsync(f.fileno())
+
+
+class JsonStore:
+    # Original layout: the whole chain as one pretty-printed JSON array
+    def __init__(self, path=CHAIN_FILE, durability=None):
+        self.path = path
+        self.write_lock = FileLock(path)
+        durability = durability or DEFAULT_DURABILITY
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        if durability == "group":
+            # every append rewrites the whole file; there is no append to group
+            raise ValueError("Group commit needs log or binary storage")
+        self.durability = durability
+        self.signature = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        with open(self.path, "r") as f:
+            self.signature = _file_signature(f.fileno())
+            return json.load(f, object_hook=intern_record)
+
+    def read_new(self):
+        # None means "changed in a way we can't patch in": reload everything
+        try:
+            signature = _file_signature(self.path)
+        except FileNotFoundError:
+            return None
+        return [] if signature == self.signature else None
+
+    def save(self, chain):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump([block.to_dict() for block in chain], f, indent=4)
+            f.flush()
+            if self.durability != "buffered":
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.signature = _file_signature(self.path)
+
+    def append(self, chain, start):
+        # a JSON array cannot be extended in place, so rewrite everything
+        self.save(chain)
+
+    def wait_durable(self, ticket):
+        pass
+
+
+class LogStore(AppendFile):
+    # Append-only layout: one compact JSON record per line. Adding a block
+    # writes only that block, so the cost does not grow with the chain.
+    def __init__(self, path=CHAIN_LOG_FILE, durability=None):
+        self.path = path
+        self._init_append(durability)
+        self.write_lock = FileLock(path)
+        self.offset = 0  # end of the last complete record we have read
+        self.inode = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        with open(self.path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            raw = f.read()
+
+        blocks = []
+        pos = good_end = 0
+        while pos < len(raw):
+            nl = raw.find(b"\n", pos)
+            end = nl if nl != -1 else len(raw)
+            line = raw[pos:end]
+            if line.strip():
+                try:
+                    if nl == -1:
+                        raise ValueError("record without newline")
+                    blocks.append(loads_record(line))
+                except ValueError:
+                    if raw[end + 1:].strip():
+                        raise ValueError(f"Corrupt block record at byte {pos} of {self.path}")
+                    break  # torn write at the tail (crash mid-append)
+            pos = good_end = end + 1
+
+        # A half-written last record is skipped here and cut off by the next
+        # append, which holds the write lock (it may be a live writer's)
+        if good_end < len(raw):
+            print(f"🩹 Skipping {len(raw) - good_end} incomplete bytes at the end of the blockchain log.")
+        self.offset = good_end
+        return blocks
+
+    def read_new(self):
+        # Only the bytes past our offset are read; a half-written record from
+        # a concurrent writer is left for the next call.
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        size = st.st_size
+        if st.st_ino != self.inode or size < self.offset:
+            return None  # file was rewritten
+        if size == self.offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            raw = f.read(size - self.offset)
+        end = raw.rfind(b"\n") + 1
+        blocks = [loads_record(line) for line in raw[:end].splitlines() if line.strip()]
+        self.offset += end
+        return blocks
+
+    def save(self, chain):
+        self._close_handle()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for block in chain:
+                f.write(self._encode(block))
+            f.flush()
+            self._sync_new_file(f)
+            offset = f.tell()
+        os.replace(tmp_path, self.path)
+        self.offset = offset
+        self.inode = os.stat(self.path).st_ino
+
+    def append(self, chain, start):
+        # Called under write_lock after a refresh, so anything past our
+        # offset is a torn record from a crashed writer
+        f = self._append_handle()
+        f.truncate(self.offset)
+        f.seek(self.offset)
+        f.write(b"".join(self._encode(block) for block in chain[start:]))
+        ticket = self._finish_append(f)
+        self.offset = f.tell()
+        return ticket
+
+    @staticmethod
+    def _encode(block):
+        return block.encode_record() + b"\n"
+
+
+class BinaryStore(AppendFile):
+    # Compact layout: a magic string, then per block a fixed-size header
+    # followed by a length-prefixed body (the block's data bytes). Reads go
+    # through mmap and a table of block offsets, so block N or the last few
+    # blocks can be decoded without touching the rest of the file.
+    MAGIC = b"PRCHAIN1"
+    # index, nonce, version, flags, body length, timestamp, previous hash, hash, merkle root
+    HEADER = struct.Struct("<QQBBI32s64s64s64s")
+    # With FLAG_DIFFICULTY the body is followed by one byte holding the
+    # block's proof-of-work target; with FLAG_SEALED then by the seal as
+    # length-prefixed JSON
+    FLAG_SEALED = 1
+    FLAG_DIFFICULTY = 2
+    SEAL_LENGTH = struct.Struct("<H")
+
+    def __init__(self, path=CHAIN_BINARY_FILE, durability=None):
+        self.path = path
+        self._init_append(durability)
+        self.write_lock = FileLock(path)
+        self.inode = None
+        self.offsets = array("Q")  # file offset of each block header
+        self.end = 0  # end of the last complete block
+        self._body_cache = OrderedDict()
+        self._mmap = None
+        self._mapped_size = 0
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _map(self, need=None):
+        # remap only when asked for bytes past the current mapping
+        if self._mmap is not None and need is not None and need <= self._mapped_size:
+            return self._mmap
+        size = os.path.getsize(self.path)
+        if self._mmap is None or size != self._mapped_size:
+            self.close()
+            if size:
+                with open(self.path, "rb") as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped_size = size
+        return self._mmap
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _scan(self, start):
+        # Hop from header to header; bodies are skipped, not read
+        buf = self._map()
+        size = self._mapped_size
+        if start == 0:
+            if size < len(self.MAGIC) or buf[:len(self.MAGIC)] != self.MAGIC:
+                if size == 0:
+                    return 0
+                raise ValueError(f"{self.path} is not a binary blockchain file")
+            start = len(self.MAGIC)
+        pos = start
+        while pos + self.HEADER.size <= size:
+            flags, body_len = self.HEADER.unpack_from(buf, pos)[3:5]
+            end = pos + self.HEADER.size + body_len
+            if flags & self.FLAG_DIFFICULTY:
+                end += 1
+            if flags & self.FLAG_SEALED:
+                if end + self.SEAL_LENGTH.size > size:
+                    break
+                end += self.SEAL_LENGTH.size + self.SEAL_LENGTH.unpack_from(buf, end)[0]
+            if end > size:
+                break
+            self.offsets.append(pos)
+            pos = end
+        return pos
+
+    def scan(self):
+        # Rebuild the block offset table without decoding any block
+        self.close()  # the file may have been replaced since we mapped it
+        self.offsets = array("Q")
+        self._body_cache.clear()
+        self.end = self._scan(0)
+        self.inode = os.stat(self.path).st_ino
+        return len(self.offsets)
+
+    def resume_state(self, count):
+        # Where to pick up reading after the first `count` blocks
+        end = self.offsets[count] if count < len(self.offsets) else self.end
+        return {"end": end, "offsets": base64.b64encode(self.offsets[:count].tobytes()).decode()}
+
+    def resume(self, state):
+        # Adopt a saved offset table instead of scanning; read_new() then
+        # reads only the blocks written after it
+        self.close()
+        self._body_cache.clear()
+        offsets = array("Q")
+        offsets.frombytes(base64.b64decode(state["offsets"]))
+        st = os.stat(self.path)
+        if st.st_size < state["end"] or (offsets and offsets[-1] >= state["end"]):
+            raise ValueError("snapshot offsets do not fit the ledger file")
+        self.offsets = offsets
+        self.end = state["end"]
+        self.inode = st.st_ino
+        return len(offsets)
+
+    def load(self, headers_only=False):
+        self.scan()
+        if self.end < self._mapped_size:
+            # skipped here, cut off by the next locked append
+            print(f"🩹 Skipping {self._mapped_size - self.end} incomplete bytes at the end of the binary blockchain.")
+        return self._read_blocks(0, headers_only)
+
+    def read_new(self, headers_only=False):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        if st.st_ino != self.inode or st.st_size < self.end:
+            return None
+        if st.st_size <= self.end:
+            return []
+        first = len(self.offsets)
+        self.end = self._scan(self.end)
+        return self._read_blocks(first, headers_only)
+
+    def _read_blocks(self, first, headers_only):
+        # a generator, so a header-only load never holds every header dict at once
+        read = self.read_header if headers_only else self.read_block
+        return (read(n) for n in range(first, len(self.offsets)))
+
+    def read_header(self, n):
+        buf = self._map(self.offsets[n] + self.HEADER.size)
+        index, nonce, version, flags, body_len, timestamp, previous_hash, block_hash, root = \
+            self.HEADER.unpack_from(buf, self.offsets[n])
+        header = {
+            "index": index,
+            "timestamp": timestamp.rstrip(b"\0").decode(),
+            "previous_hash": previous_hash.rstrip(b"\0").decode(),
+            "nonce": nonce,
+            "hash": block_hash.rstrip(b"\0").decode(),
+        }
+        if version != FORMAT_LEGACY:
+            header["version"] = version
+        if root.strip(b"\0"):
+            header["merkle_root"] = root.rstrip(b"\0").decode()
+        seal_at = self.offsets[n] + self.HEADER.size + body_len
+        if flags & self.FLAG_DIFFICULTY:
+            header["difficulty"] = self._map(seal_at + 1)[seal_at]
+            seal_at += 1
+        if flags & self.FLAG_SEALED:
+            buf = self._map(seal_at + self.SEAL_LENGTH.size)
+            seal_len = self.SEAL_LENGTH.unpack_from(buf, seal_at)[0]
+            seal_at += self.SEAL_LENGTH.size
+            header["seal"] = json.loads(self._map(seal_at + seal_len)[seal_at:seal_at + seal_len])
+        return header
+
+    def read_body_bytes(self, n):
+        start = self.offsets[n] + self.HEADER.size
+        body_len = self.HEADER.unpack_from(self._map(start), self.offsets[n])[4]
+        return self._map(start + body_len)[start:start + body_len]
+
+    def read_body(self, n):
+        # LRU-cached so hot blocks are decoded once, while memory stays bounded
+        if n in self._body_cache:
+            self._body_cache.move_to_end(n)
+            return self._body_cache[n]
+        body = loads_record(self.read_body_bytes(n))
+        self._body_cache[n] = body
+        if len(self._body_cache) > BODY_CACHE_SIZE:
+            self._body_cache.popitem(last=False)
+        return body
+
+    def read_block(self, n):
+        block = self.read_header(n)
+        block["data"] = self.read_body(n)
+        return block
+
+    def _encode(self, block):
+        body = block.data_bytes()
+        if len(block.timestamp.encode()) > 32 or max(len(block.previous_hash), len(block.hash), len(block.merkle_root or "")) > 64:
+            raise ValueError(f"Block {block.index} does not fit the binary header layout")
+        flags = 0
+        extra = b""
+        if block.difficulty is not None:
+            flags |= self.FLAG_DIFFICULTY
+            extra += bytes([block.difficulty])
+        if block.seal is not None:
+            flags |= self.FLAG_SEALED
+            seal = canonical_bytes(block.seal)
+            extra += self.SEAL_LENGTH.pack(len(seal)) + seal
+        header = self.HEADER.pack(
+            block.index, block.nonce, block.version, flags, len(body),
+            block.timestamp.encode(), block.previous_hash.encode(), block.hash.encode(),
+            (block.merkle_root or "").encode()
+        )
+        return header + body + extra
+
+    def _write(self, f, chain, start, pos):
+        for block in chain[start:]:
+            record = self._encode(block)
+            f.write(record)
+            self.offsets.append(pos)
+            pos += len(record)
+        return pos
+
+    def save(self, chain):
+        self.close()
+        self._close_handle()
+        tmp_path = self.path + ".tmp"
+        self.offsets = array("Q")
+        self._body_cache.clear()
+        with open(tmp_path, "wb") as f:
+            f.write(self.MAGIC)
+            self.end = self._write(f, chain, 0, len(self.MAGIC))
+            f.flush()
+            self._sync_new_file(f)
+        os.replace(tmp_path, self.path)
+        self.inode = os.stat(self.path).st_ino
+
+    def append(self, chain, start):
+        self.close()  # unmap before resizing the file (required on Windows)
+        f = self._append_handle()
+        if self.end == 0:
+            f.write(self.MAGIC)
+            self.end = len(self.MAGIC)
+        f.truncate(self.end)  # drop a torn block left by a crashed writer
+        f.seek(self.end)
+        self.end = self._write(f, chain, start, self.end)
+        return self._finish_append(f)
+
+
+def _file_signature(path_or_fd):
+    st = os.stat(path_or_fd)
+    return (st.st_mtime_ns, st.st_size)
+
+
+STORES = {
+    "json": JsonStore,
+    "log": LogStore,
+    "binary": BinaryStore,
+}
+
+STORE_FILES = {
+    "json": CHAIN_FILE,
+    "log": CHAIN_LOG_FILE,
+    "binary": CHAIN_BINARY_FILE,
+}
+
+STORE_EXTENSIONS = {
+    ".json": JsonStore,
+    ".jsonl": LogStore,
+    ".bin": BinaryStore,
+}
+
+
+def open_store(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in STORE_EXTENSIONS:
+        raise ValueError(f"Can't tell the blockchain format of {path} (expected .json, .jsonl or .bin)")
+    return STORE_EXTENSIONS[ext](path)
+
+
+def convert_chain(src_path, dst_path):
+    # Rewrite a ledger in another on-disk format, e.g. blockchain.json -> blockchain.bin
+    blocks = [Block.from_dict(block) for block in open_store(src_path).load()]
+    dst = open_store(dst_path)
+    dst.save(blocks)
+    if hasattr(dst, "close"):
+        dst.close()
+    return len(blocks)
+
+
+# --- Derived indexes ---
+
+# Every index has a name, add()/clear(), and to_state()/load_state() so its
+# contents can be written to and restored from snapshot files. to_state()
+# returns copies (snapshots are encoded outside the chain lock) and keeps
+# keyed maps as [key, entries] pairs: JSON object keys are always strings,
+# so a patient ID of 7 would come back as "7".
+
+
+def _intern_key(key):
+    return sys.intern(key) if isinstance(key, str) else key
+
+class PatientIndex:
+    # patient ID -> (block position, record position) of each of their records
+    name = "patient"
+
+    def __init__(self):
+        self.positions = {}
+
+    def clear(self):
+        self.positions = {}
+
+    def add(self, position, block):
+        for record_pos, record in enumerate(block.records()):
+            if record.get("patient ID") is not None:
+                self.positions.setdefault(record["patient ID"], []).append((position, record_pos))
+
+    def lookup(self, patient_id):
+        return self.positions.get(patient_id, [])
+
+    def to_state(self):
+        return [[patient_id, list(entries)] for patient_id, entries in self.positions.items()]
+
+    def load_state(self, state):
+        self.positions = {
+            _intern_key(patient_id): [tuple(entry) for entry in entries]
+            for patient_id, entries in state
+        }
+
+
+class CidIndex:
+    # IPFS CID -> (block position, record position) of every record that
+    # references it; more than one entry means the CID was committed twice
+    name = "cid"
+
+    def __init__(self):
+        self.positions = {}
+
+    def clear(self):
+        self.positions = {}
+
+    def add(self, position, block):
+        for record_pos, record in enumerate(block.records()):
+            cid = record.get("cid")
+            if cid is not None:
+                self.positions.setdefault(cid, []).append((position, record_pos))
+
+    def lookup(self, cid):
+        return self.positions.get(cid, [])
+
+    def duplicates(self):
+        return {cid: entries for cid, entries in self.positions.items() if len(entries) > 1}
+
+    def to_state(self):
+        return [[cid, list(entries)] for cid, entries in self.positions.items()]
+
+    def load_state(self, state):
+        self.positions = {cid: [tuple(entry) for entry in entries] for cid, entries in state}
+
+
+class FacetIndex:
+    # Records are numbered in chain order (ordinals); for every value of each
+    # FACET_FIELDS field the index keeps the ascending array of ordinals of
+    # the records holding it. Filters union the arrays of the values picked
+    # within a field and intersect (or union) across fields, starting from
+    # the smallest, so cost follows the matching sets rather than the chain.
+    name = "facet"
+
     def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.entries = []  # ordinal -> (block position, record position)
+        self.block_start = array("q")  # block position -> ordinal of its first record
+        self.values = {field: {} for field in FACET_FIELDS}  # field -> value -> ordinals
+
+    def add(self, position, block):
+        # called for every block in chain order, so block_start[position] lines up
+        self.block_start.append(len(self.entries))
+        for record_pos, record in enumerate(block.records()):
+            ordinal = len(self.entries)
+            self.entries.append((position, record_pos))
+            for field in FACET_FIELDS:
+                value = record.get(field)
+                if value is not None:
+                    self.values[field].setdefault(str(value), array("q")).append(ordinal)
+
+    def counts(self, field):
+        # value -> number of records, for building filter choices
+        return {value: len(ordinals) for value, ordinals in self.values[field].items()}
+
+    def _field_ordinals(self, field, values):
+        postings = [self.values[field][value] for value in values if value in self.values[field]]
+        return postings[0] if len(postings) == 1 else set().union(*postings)
+
+    def _block_ordinals(self, positions):
+        ordinals = []
+        for position in positions:
+            stop = self.block_start[position + 1] if position + 1 < len(self.block_start) else len(self.entries)
+            ordinals.extend(range(self.block_start[position], stop))
+        return ordinals
+
+    def query(self, filters, match="all", positions=None):
+        # filters: {field: [values]}; match "all" ANDs the fields, "any" ORs
+        # them. positions (block positions, e.g. a date range) always
+        # restricts the result. Returns ordinals, ascending.
+        groups = [self._field_ordinals(field, values) for field, values in filters.items() if values]
+        if match == "any" and groups:
+            result = set().union(*groups)
+        elif groups:
+            groups.sort(key=len)
+            result = set(groups[0])
+            for group in groups[1:]:
+                if not result:
+                    break
+                result.intersection_update(group)
+        else:
+            result = None
+        if positions is not None:
+            in_range = self._block_ordinals(positions)
+            result = set(in_range) if result is None else result.intersection(in_range)
+        return list(range(len(self.entries))) if result is None else sorted(result)
+
+    def to_state(self):
+        return {
+            "entries": list(self.entries),
+            "block_start": self.block_start.tolist(),
+            "values": [[field, [[value, ordinals.tolist()] for value, ordinals in values.items()]]
+                       for field, values in self.values.items()],
+        }
+
+    def load_state(self, state):
+        self.entries = [tuple(entry) for entry in state["entries"]]
+        self.block_start = array("q", state["block_start"])
+        self.values = {field: {} for field in FACET_FIELDS}
+        for field, values in state["values"]:
+            self.values[field] = {_intern_key(value): array("q", ordinals) for value, ordinals in values}
+
+
+def _insert_sorted(keys, values, key, value):
+    # blocks almost always arrive in time order, so this is usually an append
+    if not keys or key >= keys[-1]:
+        keys.append(key)
+        values.append(value)
+    else:
+        at = bisect.bisect_right(keys, key)
+        keys.insert(at, key)
+        values.insert(at, value)
+
+
+class TimeIndex:
+    # Block timestamps as epoch seconds, kept sorted globally (-> block
+    # position) and per patient (-> (block position, record position)), so a
+    # date range is two bisects plus the matches. Timestamps are parsed once,
+    # when a block is indexed. Records of blocks whose timestamp does not
+    # parse are kept apart in `undated`.
+    name = "time"
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.epochs = array("q")
+        self.blocks = array("q")
+        self.patients = {}  # patient ID -> (epochs, [(block position, record position)])
+        self.undated = {}  # patient ID -> [(block position, record position)]
+
+    def add(self, position, block):
+        epoch = timestamp_epoch(block.timestamp)
+        if epoch is not None:
+            _insert_sorted(self.epochs, self.blocks, epoch, position)
+        for record_pos, record in enumerate(block.records()):
+            patient_id = record.get("patient ID")
+            if patient_id is None:
+                continue
+            if epoch is None:
+                self.undated.setdefault(patient_id, []).append((position, record_pos))
+            else:
+                epochs, entries = self.patients.setdefault(patient_id, (array("q"), []))
+                _insert_sorted(epochs, entries, epoch, (position, record_pos))
+
+    @staticmethod
+    def _window(epochs, start, end):
+        lo = 0 if start is None else bisect.bisect_left(epochs, start)
+        hi = len(epochs) if end is None else bisect.bisect_right(epochs, end)
+        return lo, hi
+
+    def between(self, start=None, end=None):
+        # block positions with start <= timestamp <= end (epoch seconds), oldest first
+        lo, hi = self._window(self.epochs, start, end)
+        return self.blocks[lo:hi].tolist()
+
+    def patient_between(self, patient_id, start=None, end=None):
+        # the patient's (block position, record position) pairs in the range, oldest first
+        epochs, entries = self.patients.get(patient_id, (array("q"), []))
+        lo, hi = self._window(epochs, start, end)
+        return entries[lo:hi]
+
+    def to_state(self):
+        return {
+            "epochs": self.epochs.tolist(),
+            "blocks": self.blocks.tolist(),
+            "patients": [[patient_id, epochs.tolist(), list(entries)]
+                         for patient_id, (epochs, entries) in self.patients.items()],
+            "undated": [[patient_id, list(entries)] for patient_id, entries in self.undated.items()],
+        }
+
+    def load_state(self, state):
+        self.epochs = array("q", state["epochs"])
+        self.blocks = array("q", state["blocks"])
+        self.patients = {
+            _intern_key(patient_id): (array("q", epochs), [tuple(entry) for entry in entries])
+            for patient_id, epochs, entries in state["patients"]
+        }
+        self.undated = {
+            _intern_key(patient_id): [tuple(entry) for entry in entries]
+            for patient_id, entries in state["undated"]
+        }
+
+
+# --- Snapshots ---
+# "<ledger>.snapshot.<height>.json" holds the index state after block
+# <height> and that block's hash. On load the newest snapshot whose tip
+# still matches the chain is restored and only later blocks are indexed.
+# Lazy (binary) snapshots also hold the header columns and the store's
+# offset table, so startup reads only the blocks after <height>; the other
+# modes keep every block in memory and still parse the whole ledger.
+
+def snapshot_paths(ledger_path):
+    # newest first
+    found = []
+    for path in glob.glob(glob.escape(ledger_path) + ".snapshot.*.json"):
+        try:
+            found.append((int(path.rsplit(".", 2)[-2]), path))
+        except ValueError:
+            continue
+    return [path for _, path in sorted(found, reverse=True)]
+
+
+class Blockchain:
+    def __init__(self, storage=None, lazy=None, durability=None, consensus=None, path=None, block_format=None):
         self.chain = []
-        self.difficulty = 2
+        self.difficulty = DEFAULT_DIFFICULTY  # for new blocks; each block is checked at its own
+        self.min_difficulty = MIN_DIFFICULTY
+        # block_format opts new blocks into another format, e.g. FORMAT_BLAKE2B;
+        # batches keep BATCH_FORMAT if it can't hold a list of records
+        if block_format is not None and block_format not in HASH_ALGORITHMS:
+            raise ValueError(f"Unknown block format: {block_format}")
+        self.block_format = BLOCK_FORMAT if block_format is None else block_format
+        self.batch_format = self.block_format if self.block_format in MERKLE_FORMATS else BATCH_FORMAT
+        # a CONSENSUS name or a ready sealer, e.g. ProofOfAuthority(authorities=[...])
+        consensus = consensus or DEFAULT_CONSENSUS
+        if isinstance(consensus, str):
+            if consensus not in CONSENSUS:
+                raise ValueError(f"Unknown consensus: {consensus}")
+            consensus = CONSENSUS[consensus]()
+        self.consensus = consensus
+        self.storage = storage or DEFAULT_STORAGE
+        if self.storage not in STORES:
+            raise ValueError(f"Unknown blockchain storage: {self.storage}")
+        # path: a ledger file other than the storage's default (e.g. a shard)
+        self.store = STORES[self.storage](path or STORE_FILES[self.storage], durability=durability)
+        # Lazy bodies need a store with random access to each block's body
+        can_lazy = hasattr(self.store, "read_body")
+        if lazy and not can_lazy:
+            raise ValueError(f"{self.storage} storage can't load block bodies lazily")
+        self.lazy = can_lazy if lazy is None else lazy
+        self.lock = threading.RLock()
+        self.patient_index = PatientIndex()
+        self.time_index = TimeIndex()
+        self.cid_index = CidIndex()
+        self.facet_index = FacetIndex()
+        self.indexes = [self.patient_index, self.time_index, self.cid_index, self.facet_index]
+        self._indexed = 0  # blocks [0, _indexed) are in every index
+        self._snapshot_height = -1
+        self._snapshot_lock = threading.Lock()  # one snapshot write at a time
+        self._snapshot_thread = None
         self.load_chain()
 
     def create_genesis_block(self):
         return Block(0, "0", "Genesis Block")
 
+    def mining_workers(self):
+        if self.difficulty < PARALLEL_MINING_MIN_DIFFICULTY:
+            return 1
+        return MINING_WORKERS
+
     def get_latest_block(self):
         return self.chain[-1] if self.chain else None
 
+    # Range access. In lazy (binary) mode the chain is BlockColumns: a slice
+    # materializes only the requested blocks and reads their bodies through
+    # the store's offset table, so a page costs the same wherever it is.
+
+    def get_block_range(self, start, stop):
+        # blocks [start, stop), clipped to the chain
+        with self.lock:
+            start, stop = max(0, start), min(stop, len(self.chain))
+            return self.chain[start:stop] if start < stop else []
+
+    def tail(self, count):
+        with self.lock:
+            return self.get_block_range(len(self.chain) - count, len(self.chain))
+
+    def iter_reverse(self, start=None, batch=100):
+        # newest first from block `start` (default: the tip), `batch` blocks per read
+        with self.lock:
+            position = len(self.chain) - 1 if start is None else min(start, len(self.chain) - 1)
+        while position >= 0:
+            yield from reversed(self.get_block_range(position - batch + 1, position + 1))
+            position -= batch
+
+    def get_page(self, page, page_size=10):
+        # Page 0 holds the newest page_size blocks. Returns (blocks newest
+        # first, number of pages); page is clamped to the last page.
+        with self.lock:
+            pages = max(1, -(-len(self.chain) // page_size))
+            page = min(max(0, page), pages - 1)
+            stop = len(self.chain) - page * page_size
+            return self.get_block_range(stop - page_size, stop)[::-1], pages
+
     def add_block(self, data):
-        previous_block = self.get_latest_block() or self.create_genesis_block()
-        new_block = Block(index=len(self.chain),
-                          previous_hash=previous_block.hash,
-                          data=data)
-        new_block.mine_block(self.difficulty)
-        self.chain.append(new_block)
-        self.save_chain()
+        block = self._commit(data, self.block_format)
         print("✅ Block added to blockchain.")
+        return block
+
+    def add_records(self, records):
+        # Commit a batch of records as one block: one seal, one write
+        records = list(records)
+        if not records:
+            raise ValueError("add_records needs at least one record")
+        block = self._commit(records, self.batch_format)
+        print(f"✅ Block with {len(records)} records added to blockchain.")
+        return block
+
+    def _commit(self, data, version):
+        # Seal (mine or sign) without the cross-process lock, then take it,
+        # re-read the tip and only append if nobody else extended the chain
+        # meanwhile; otherwise seal again on the new tip.
+        with self.lock:
+            while True:
+                self.refresh()
+                previous_block = self.get_latest_block() or self.create_genesis_block()
+                new_block = Block(index=len(self.chain),
+                                  previous_hash=previous_block.hash,
+                                  data=data,
+                                  version=version,
+                                  difficulty=self.consensus.block_difficulty(self))
+                self.consensus.seal(new_block, self)
+                with self.store.write_lock:
+                    self.refresh()
+                    if self.get_latest_block().hash != previous_block.hash:
+                        print("🔁 Chain tip moved while sealing; resealing on the new tip.")
+                        continue
+                    self.chain.append(new_block)
+                    ticket = self.store.append(self.chain, len(self.chain) - 1)
+                    if self.lazy:
+                        self.chain.release()
+                    break
+        # Outside the locks, so concurrent commits can share one fsync
+        self.store.wait_durable(ticket)
+        return new_block
+
+    def extension_problem(self, blocks, start=None):
+        # Why `blocks` can't follow our first `start` blocks (default: the
+        # whole chain), or None. Seals are checked as one batch after every
+        # hash and link holds.
+        start = len(self.chain) if start is None else start
+        previous_hash = self.chain[start - 1].hash if start else None
+        sealed = []
+        for position, block in enumerate(blocks, start):
+            problem = block_problem(block, position, previous_hash, self.min_difficulty)
+            if problem:
+                return f"block #{position}: {problem}"
+            if block.seal is not None:
+                sealed.append((position, block))
+            previous_hash = block.hash
+        bad_seal = self.consensus.check_seals(sealed)
+        if bad_seal is not None:
+            return f"block #{bad_seal}: seal is not from a trusted authority"
+        return None
+
+    def append_blocks(self, blocks):
+        # Append blocks sealed elsewhere (e.g. pulled from a peer) on top of
+        # our tip: validated before taking the cross-process lock, then
+        # written through the same locked append as _commit. Raises
+        # ValueError if they don't extend our current tip.
+        blocks = list(blocks)
+        if not blocks:
+            return 0
+        with self.lock:
+            while True:
+                self.refresh()
+                tip_hash = self.chain[-1].hash
+                problem = self.extension_problem(blocks)
+                if problem:
+                    raise ValueError(problem)
+                with self.store.write_lock:
+                    self.refresh()
+                    if self.chain[-1].hash != tip_hash:
+                        continue  # chain moved meanwhile: validate against the new tip
+                    start = len(self.chain)
+                    self.chain.extend(blocks)
+                    ticket = self.store.append(self.chain, start)
+                    if self.lazy:
+                        self.chain.release()
+                    break
+        self.store.wait_durable(ticket)
+        return len(blocks)
+
+    def adopt_chain(self, blocks):
+        # First sync of a new replica: replace a chain that holds nothing but
+        # our own genesis block with a peer's complete chain
+        blocks = list(blocks)
+        with self.lock, self.store.write_lock:
+            self.refresh()
+            if len(self.chain) > 1:
+                raise ValueError("only a chain with nothing but its genesis block can be replaced")
+            problem = self.extension_problem(blocks, start=0)
+            if problem:
+                raise ValueError(problem)
+            self.store.save(blocks)
+            self.load_chain()
+        return len(blocks)
 
     def save_chain(self):
-        with open("blockchain.json", "w") as f:
-            json.dump([block.to_dict() for block in self.chain], f, indent=4)
+        self.store.save(self.chain)
+
+    def _create_store(self):
+        with self.store.write_lock:
+            if self.store.exists():
+                return  # another process won the race
+            if self.storage != "json" and self.store.path == STORE_FILES[self.storage] and os.path.exists(CHAIN_FILE):
+                # First start in this mode: import the existing JSON ledger once
+                self.store.save([Block.from_dict(block) for block in JsonStore().load()])
+                print(f"📦 Migrated blockchain.json to {self.storage} storage.")
+            else:
+                print("🔃 No blockchain found. Creating new one.")
+                self.store.save([self.create_genesis_block()])
+
+    def refresh(self):
+        # Pick up blocks written by other processes since our last read
+        with self.lock:
+            if self.lazy:
+                new_blocks = self.store.read_new(headers_only=True)
+                if new_blocks is not None:
+                    self.chain.extend_headers(new_blocks)
+            else:
+                new_blocks = self.store.read_new()
+                if new_blocks is not None:
+                    self.chain.extend(Block.from_dict(block) for block in new_blocks)
+            if new_blocks is None:
+                self.load_chain()
+            return self
+
+    def _sync_indexes(self):
+        # Indexes catch up on first use rather than at load, so startup only
+        # pays for headers; bodies pass through the bounded cache once.
+        self._index_new_blocks()
+        due = max(SNAPSHOT_INTERVAL, int(self._snapshot_height * SNAPSHOT_GROWTH))
+        if self._indexed - 1 - self._snapshot_height >= due:
+            self._start_snapshot()
+
+    def _index_new_blocks(self):
+        for position in range(self._indexed, len(self.chain)):
+            block = self.chain[position]
+            for index in self.indexes:
+                index.add(position, block)
+        self._indexed = len(self.chain)
+
+    def _start_snapshot(self):
+        # Automatic snapshots are written by a background thread, so the
+        # query that crosses the interval doesn't wait for the file
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return
+        self._snapshot_thread = threading.Thread(target=self._background_snapshot, name="index-snapshot",
+                                                 daemon=True)
+        self._snapshot_thread.start()
+
+    def _background_snapshot(self):
+        try:
+            self.write_snapshot()
+        except OSError as e:
+            print(f"⚠️ Index snapshot failed: {e}")
+
+    def write_snapshot(self):
+        # The index state is copied under the chain lock; encoding and
+        # writing the file happen outside it
+        with self._snapshot_lock:
+            with self.lock:
+                self._index_new_blocks()
+                height = self._indexed - 1
+                tip_hash = self.chain[height].hash
+                snapshot = {
+                    "format": SNAPSHOT_FORMAT,
+                    "height": height,
+                    "tip_hash": tip_hash,
+                    "indexes": {index.name: index.to_state() for index in self.indexes},
+                }
+                if self.lazy and not any(position <= height for position in self.chain.held):
+                    snapshot["store"] = self.store.resume_state(height + 1)
+                    snapshot["columns"] = self.chain.to_state(height + 1)
+            path = f"{self.store.path}.snapshot.{height}.json"
+            with open(path + ".tmp", "w") as f:
+                json.dump(snapshot, f, separators=(",", ":"))
+            os.replace(path + ".tmp", path)
+            with self.lock:
+                # unless the chain was reloaded meanwhile
+                if height < len(self.chain) and self.chain[height].hash == tip_hash:
+                    self._snapshot_height = max(self._snapshot_height, height)
+            for old in snapshot_paths(self.store.path)[SNAPSHOT_KEEP:]:
+                os.remove(old)
+            return path
+
+    def _snapshots(self):
+        # parsed snapshot files of this ledger, newest first
+        for path in snapshot_paths(self.store.path):
+            try:
+                with open(path, "r") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if isinstance(snapshot, dict) and snapshot.get("format") == SNAPSHOT_FORMAT:
+                yield snapshot
+
+    def _resume_snapshot(self):
+        # Lazy mode: take the header columns and the store's offset table
+        # from the newest snapshot whose tip is still in the file, then read
+        # only the blocks written after it instead of scanning them all
+        for snapshot in self._snapshots():
+            if "store" not in snapshot:
+                continue
+            chain = BlockColumns(self.store)
+            try:
+                height = snapshot["height"]
+                self.store.resume(snapshot["store"])
+                chain.load_state(snapshot["columns"])
+                if len(chain) != height + 1 or chain[height].hash != snapshot["tip_hash"] \
+                        or self.store.read_header(height)["hash"] != snapshot["tip_hash"]:
+                    continue
+                new_headers = self.store.read_new(headers_only=True)
+                if new_headers is None:
+                    continue
+                chain.extend_headers(new_headers)
+            except (OSError, ValueError, KeyError, TypeError, IndexError, struct.error):
+                continue
+            self.chain = chain
+            self._reset_indexes()
+            self._restore_indexes(snapshot)
+            print(f"📂 Blockchain headers resumed from snapshot at block #{height}.")
+            return True
+        return False
+
+    def _load_snapshot(self):
+        for snapshot in self._snapshots():
+            try:
+                height = snapshot["height"]
+                if height >= len(self.chain) or self.chain[height].hash != snapshot["tip_hash"]:
+                    continue
+            except (KeyError, TypeError):
+                continue
+            if self._restore_indexes(snapshot):
+                return True
+        return False
+
+    def _restore_indexes(self, snapshot):
+        height = snapshot["height"]
+        try:
+            if set(snapshot["indexes"]) != {index.name for index in self.indexes}:
+                return False
+            for index in self.indexes:
+                index.load_state(snapshot["indexes"][index.name])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self._reset_indexes()
+            return False
+        self._snapshot_height = height
+        self._indexed = height + 1
+        print(f"📸 Restored indexes from snapshot at block #{height}.")
+        return True
+
+    def _reset_indexes(self):
+        for index in self.indexes:
+            index.clear()
+        self._indexed = 0
+        self._snapshot_height = -1
+
+    def get_blocks_by_patient(self, patient_id):
+        with self.lock:
+            self._sync_indexes()
+            positions = dict.fromkeys(position for position, _ in self.patient_index.lookup(patient_id))
+            return [self.chain[position] for position in positions]
+
+    def get_records_by_patient(self, patient_id):
+        # [(block, record position, record)] for one patient
+        with self.lock:
+            self._sync_indexes()
+            return [
+                (self.chain[position], record_pos, self.chain[position].records()[record_pos])
+                for position, record_pos in self.patient_index.lookup(patient_id)
+            ]
+
+    def get_records_by_cid(self, cid):
+        # [(block, record position, record)] referencing an IPFS CID, first
+        # commit first; more than one entry means a duplicate upload
+        with self.lock:
+            self._sync_indexes()
+            return [
+                (self.chain[position], record_pos, self.chain[position].records()[record_pos])
+                for position, record_pos in self.cid_index.lookup(cid)
+            ]
+
+    def has_cid(self, cid):
+        with self.lock:
+            self._sync_indexes()
+            return bool(self.cid_index.lookup(cid))
+
+    def facet_counts(self, field):
+        with self.lock:
+            self._sync_indexes()
+            return self.facet_index.counts(field)
+
+    def query_records(self, filters=None, start=None, end=None, match="all", limit=None):
+        # Faceted record search: filters {field: [values]} over FACET_FIELDS,
+        # values within a field ORed, fields combined per `match` ("all" or
+        # "any"), block timestamp within [start, end] (datetimes). Returns
+        # (number of matches, [(block, record position, record)] newest first,
+        # at most `limit` of them).
+        with self.lock:
+            self._sync_indexes()
+            positions = None
+            if start or end:
+                positions = self.time_index.between(timestamp_epoch(start) if start else None,
+                                                    timestamp_epoch(end) if end else None)
+            ordinals = self.facet_index.query(filters or {}, match, positions)
+            shown = ordinals[::-1] if limit is None else ordinals[:-limit - 1:-1]
+            results = []
+            for ordinal in shown:
+                position, record_pos = self.facet_index.entries[ordinal]
+                block = self.chain[position]
+                results.append((block, record_pos, block.records()[record_pos]))
+            return len(ordinals), results
+
+    def count_records_by_patient(self, patient_id):
+        with self.lock:
+            self._sync_indexes()
+            return len(self.patient_index.lookup(patient_id))
+
+    def get_records_by_time(self, patient_id, start=None, end=None):
+        # [(block, record position, record)] for one patient with
+        # start <= block timestamp <= end (datetimes, inclusive; None = open),
+        # oldest first. Records with unparseable timestamps always match and
+        # come first.
+        with self.lock:
+            self._sync_indexes()
+            positions = self.time_index.undated.get(patient_id, []) + self.time_index.patient_between(
+                patient_id, timestamp_epoch(start) if start else None, timestamp_epoch(end) if end else None)
+            return [
+                (self.chain[position], record_pos, self.chain[position].records()[record_pos])
+                for position, record_pos in positions
+            ]
+
+    def get_blocks_by_time(self, start=None, end=None):
+        # blocks with start <= timestamp <= end (datetimes, inclusive), oldest first
+        with self.lock:
+            self._sync_indexes()
+            positions = self.time_index.between(timestamp_epoch(start) if start else None,
+                                                timestamp_epoch(end) if end else None)
+            return [self.chain[position] for position in positions]
+
+    def get_record_proof(self, block_index, record_pos=0, upto=None):
+        # Inclusion proof for one record plus the header path from its block
+        # to block `upto` (default: just its own header). Paths longer than
+        # PROOF_MAX_HEADERS are refused: anchor to a closer trusted block.
+        with self.lock:
+            block = self.chain[block_index]
+            records = block.records()
+            end = block_index if upto is None else upto
+            if not block_index <= end < len(self.chain):
+                raise ValueError(f"upto must be between block {block_index} and the tip")
+            if end - block_index + 1 > PROOF_MAX_HEADERS:
+                raise ValueError(f"A proof spans at most {PROOF_MAX_HEADERS} headers")
+            return {
+                "record": records[record_pos],
+                "leaf_index": record_pos,
+                "path": merkle_proof(records, record_pos, block.hash_algorithm())
+                if block.version in MERKLE_FORMATS else [],
+                "headers": [self.chain[i].proof_header() for i in range(block_index, end + 1)]
+            }
+
+    def verify(self, full=False):
+        # Returns (True, None) or (False, index of the first invalid block).
+        # Starts after the verified checkpoint unless full=True or the
+        # checkpointed block no longer matches the chain.
+        with self.lock:
+            start = 0
+            checkpoint = None if full else read_checkpoint(self.store.path)
+            if checkpoint:
+                height, block_hash = checkpoint
+                if height < len(self.chain) and self.chain[height].hash == block_hash:
+                    start = height + 1
+            previous_hash = self.chain[start - 1].hash if start else None
+            bad = None
+            sealed = []
+            for position in range(start, len(self.chain)):
+                block = self.chain[position]
+                if block_problem(block, position, previous_hash, self.min_difficulty):
+                    bad = position
+                    break
+                if block.seal is not None:
+                    sealed.append((position, block))
+                previous_hash = block.hash
+            # signatures are checked as one batch once hashes and links hold
+            bad_seal = self.consensus.check_seals(sealed)
+            if bad_seal is not None:
+                bad = bad_seal
+            if bad is not None:
+                return False, bad
+            if self.chain and start < len(self.chain):
+                write_checkpoint(self.store.path, len(self.chain) - 1, self.chain[-1].hash)
+            return True, None
+
+    def is_valid(self, full=False):
+        return self.verify(full)[0]
 
     def load_chain(self):
+        if not self.store.exists():
+            self._create_store()
         try:
-            with open("blockchain.json", "r") as f:
-                data = json.load(f)
+            if self.lazy and self._resume_snapshot():
+                return
+            if self.lazy:
+                self.chain = BlockColumns(self.store)
+                self.chain.extend_headers(self.store.load(headers_only=True))
+                print("📂 Blockchain headers loaded.")
+            else:
+                data = self.store.load()
                 self.chain = [Block.from_dict(block) for block in data]
                 print("📂 Blockchain loaded.")
         except FileNotFoundError:
-            print("🔃 No blockchain found. Creating new one.")
-            self.chain = [self.create_genesis_block()]
-            self.save_chain()
+            # removed between our check and the read
+            self._create_store()
+            return self.load_chain()
+        self._reset_indexes()
+        self._load_snapshot()
+
+
+
+# --- Shared chain model ---
+# One in-memory chain per process; callers get it refreshed incrementally
+# instead of re-parsing the ledger on every request.
+
+_shared_chain = None
+_shared_chain_lock = threading.Lock()
+
 
+def get_shared_chain():
+    global _shared_chain
+    with _shared_chain_lock:
+        if _shared_chain is None:
+            _shared_chain = Blockchain()
+            ok, position = _shared_chain.verify()
+            if not ok:
+                print(f"⚠️ Blockchain integrity check failed at block #{position}.")
+            return _shared_chain
+    return _shared_chain.refresh()
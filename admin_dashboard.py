@@ -11,13 +11,24 @@ from dash.dependencies import Input, Output, State, MATCH, ALL
 import dash_bootstrap_components as dbc
 import ipfshttpclient
 
-from Blockchain import Blockchain  # your existing blockchain implementation
+from Blockchain import get_shared_chain  # process-wide chain, refreshed incrementally
+from commit_queue import get_commit_queue
+from patient_dashboard import parse_picker_date
 
 
 # ---------------------
 # Helper functions
 # ---------------------
 USERS_FILE = "users.json"
+CHAIN_PAGE_SIZE = 10  # blocks per page in the View Blocks tab
+FACET_RESULT_LIMIT = 100  # newest matching records shown by the record filter
+# filter dropdown id -> record field
+FACET_INPUTS = {
+    "facet-file-type": "File Type",
+    "facet-disease": "Disease",
+    "facet-file-status": "File Status",
+    "facet-uploaded-by": "Uploaded By",
+}
 
 def load_patients():
     try:
@@ -132,9 +143,9 @@ def fetch_from_ipfs(cid):
 
 
         
-def render_chain(chain):
+def render_chain(blocks):
     cols = []
-    for block in chain[-10:]:
+    for block in blocks:
         card = dbc.Card(
             dbc.CardBody([
                 html.H6(f"🧱 Block #{block.index}", style={"marginBottom": "6px"}),
@@ -142,6 +153,7 @@ def render_chain(chain):
                 html.Div(f"Hash: {block.hash}", className="small text-truncate mb-1"),
                 html.Div(f"Prev: {block.previous_hash}", className="small text-truncate mb-1"),
                 html.Div(f"Nonce: {block.nonce}", className="small text-muted mb-2"),
+                html.Div(f"Merkle root: {block.merkle_root}", className="small text-truncate mb-1") if block.merkle_root else None,
                 html.Hr(),
                 # Data preview with max height + scroll
                 html.Div(
@@ -156,7 +168,53 @@ def render_chain(chain):
     return dbc.Row(cols, className="g-3")
 
 
-
+def facet_options(field):
+    counts = get_shared_chain().facet_counts(field)
+    return [{"label": f"{value} ({count})", "value": value} for value, count in sorted(counts.items())]
+
+
+def render_record_matches(total, results):
+    rows = [
+        html.Tr([
+            html.Td(f"#{block.index}"),
+            html.Td(block.timestamp),
+            html.Td(f"{record.get('Patient Name', '')} ({record.get('patient ID', '')})"),
+            html.Td(record.get("File Type", "")),
+            html.Td(record.get("Disease", "")),
+            html.Td(record.get("File Status", "")),
+            html.Td(record.get("Uploaded By", "")),
+            html.Td(record.get("cid", ""), className="text-truncate", style={"maxWidth": "160px"})
+        ])
+        for block, record_pos, record in results
+    ]
+    header = html.Thead(html.Tr([html.Th(h) for h in ["Block", "Timestamp", "Patient", "File Type", "Disease", "Status", "Uploaded By", "CID"]]))
+    return html.Div([
+        html.Div(f"Showing {len(results)} of {total} matching records (newest first).", className="small text-muted mb-2"),
+        dbc.Table([header, html.Tbody(rows)], bordered=False, hover=True, striped=True, size="sm", responsive=True)
+    ])
+
+
+def render_provenance(cid):
+    # Which block(s), patient and uploader a CID belongs to, from the chain's CID index
+    entries = get_shared_chain().get_records_by_cid(cid)
+    if not entries:
+        return dbc.Alert("⚠️ No block on the chain references this CID.", color="warning")
+    items = []
+    for block, record_pos, record in entries:
+        items.append(html.Div([
+            html.Strong(f"🧱 Block #{block.index}"),
+            html.Span(f" record {record_pos + 1} — {block.timestamp}", className="small text-muted"),
+            html.Div(f"Patient: {record.get('Patient Name', 'N/A')} (ID {record.get('patient ID', 'N/A')})", className="small"),
+            html.Div(f"Uploaded By: {record.get('Uploaded By', 'N/A')}", className="small"),
+            html.Div(f"File Type: {record.get('File Type', 'N/A')} · Disease: {record.get('Disease', 'N/A')}", className="small"),
+            html.Div(f"Hash: {block.hash}", className="small text-truncate text-muted")
+        ], className="mb-2"))
+    if len(entries) > 1:
+        items.append(dbc.Badge(f"Duplicate: committed {len(entries)} times", color="warning"))
+    return dbc.Card(
+        dbc.CardBody([html.H5("⛓️ On-chain provenance", style={"marginTop": "10px"}), *items]),
+        className="mb-3 shadow-sm"
+    )
 
 
 
@@ -185,7 +243,7 @@ def layout(username):
         dbc.CardBody([
             html.Div([
                 html.H5("📤 Upload and Add to Blockchain", className="mb-2"),
-                html.Div("Upload a report (PDF/image/Excel). Metadata will be stored on IPFS and a reference saved in the blockchain.", className="small text-muted mb-3")
+                html.Div("Upload one or more reports (PDF/image/Excel). Metadata will be stored on IPFS and all references saved together in one block.", className="small text-muted mb-3")
             ]),
             dcc.Upload(
                 id="upload-data",
@@ -200,7 +258,7 @@ def layout(username):
                     "textAlign": "center",
                     "marginBottom": "12px",
                 },
-                multiple=False
+                multiple=True
             ),
 
             html.Div(id="upload-status", style={"marginBottom": "8px", "fontWeight": "bold", "color": "green"}),
@@ -274,7 +332,9 @@ def layout(username):
             html.Div(style={"textAlign": "center"},
                      children=[dbc.Button("Add to Blockchain", id="submit-btn", n_clicks=0, color="primary")]),
 
-            html.Div(id="upload-output", style={"color": "green", "marginTop": "12px", "fontSize": "14px"})
+            html.Div(id="upload-output", style={"color": "green", "marginTop": "12px", "fontSize": "14px"}),
+            dcc.Store(id="upload-ticket"),
+            dcc.Interval(id="upload-poll", interval=1000, disabled=True)
         ]),
         className="shadow-sm",
         style={"padding": "14px", "borderRadius": "8px", "backgroundColor": "white", "maxWidth": "100%"}
@@ -284,16 +344,39 @@ def layout(username):
     view_blocks_card = dbc.Card(
         dbc.CardBody([
             dbc.Row([
-                dbc.Col(html.H5("🔍 View Last Ten Blocks on Blockchain", className="mb-0"), md=8),
+                dbc.Col(html.H5("🔍 View Blocks on Blockchain", className="mb-0"), md=8),
                 dbc.Col(html.Div([dbc.Badge("Live", color="success")], className="text-end"), md=4)
             ], className="align-items-center mb-2"),
-            html.Div(html.Button("🔄 View Blocks", id="view-chain-btn", n_clicks=0, style={"marginTop": "10px"}), style={"marginBottom": "12px"}),
+            html.Div([
+                html.Button("🔄 View Blocks", id="view-chain-btn", n_clicks=0, style={"marginTop": "10px"}),
+                dbc.ButtonGroup([
+                    dbc.Button("◀ Newer", id="chain-newer", n_clicks=0, size="sm", color="secondary", outline=True),
+                    dbc.Button("Older ▶", id="chain-older", n_clicks=0, size="sm", color="secondary", outline=True)
+                ], className="ms-2"),
+                html.Span(id="chain-page-label", className="small text-muted ms-2")
+            ], style={"marginBottom": "12px"}),
+            dcc.Store(id="chain-page", data=0),
             html.Hr(),
             html.H6("🔍 View Blocks using Patient ID", className="mb-2"),
             dbc.Row([
                 dbc.Col(dcc.Input(id="P-ID", type="text", placeholder="Enter Patient Id here", style={"width": "100%"}), md=8),
                 dbc.Col(dbc.Button("🔄 View Blocks", id="view-ID-Blocks", n_clicks=0, color="secondary", style={"width": "100%"}), md=4)
             ], className="mb-3"),
+            html.Hr(),
+            html.H6("🧮 Filter Records", className="mb-2"),
+            dbc.Row([
+                dbc.Col(dcc.Dropdown(id=input_id, options=[], multi=True, placeholder=field), md=3)
+                for input_id, field in FACET_INPUTS.items()
+            ], className="g-2 mb-2"),
+            dbc.Row([
+                dbc.Col(dcc.DatePickerRange(id="facet-dates", clearable=True), md=5),
+                dbc.Col(dbc.RadioItems(
+                    id="facet-match",
+                    options=[{"label": "Match all", "value": "all"}, {"label": "Match any", "value": "any"}],
+                    value="all", inline=True
+                ), md=4),
+                dbc.Col(dbc.Button("🔎 Search", id="facet-search", n_clicks=0, color="secondary", style={"width": "100%"}), md=3)
+            ], className="align-items-center mb-3"),
             html.Div(id="chain-container")
         ]),
         className="shadow-sm",
@@ -353,6 +436,7 @@ def layout(username):
             dbc.Tab(fetch_card, label="Fetch by CID", tab_id="tab-fetch"),
             dbc.Tab(medical_data_card, label="Set Medical Data", tab_id="tab-medical")
         ],
+        id="admin-tabs",
         active_tab="tab-add",
         className="mb-3"
     )
@@ -386,9 +470,9 @@ def register_admin_callbacks(app):
         Output("upload-status", "children"),
         Input("upload-data", "filename")
     )
-    def show_upload_status(filename):
-        if filename:
-            return f"✅ File uploaded: {filename}"
+    def show_upload_status(filenames):
+        if filenames:
+            return f"✅ File uploaded: {', '.join(filenames)}"
         return "❌ No file selected"
 
 
@@ -415,26 +499,25 @@ def register_admin_callbacks(app):
     def Chain_on_id(n_clicks, ID):
         if n_clicks == 0:
             return []
-        chain = Blockchain().chain
         cols = []
-        for block in chain:
-            if isinstance(block.data, dict) and block.data.get("patient ID") == ID:
-                card = dbc.Card(
-                    dbc.CardBody([
-                        html.H6(f"🧱 Block #{block.index}", style={"marginBottom": "6px"}),
-                        html.Div(f"Timestamp: {block.timestamp}", className="small text-muted"),
-                        html.Div(f"Hash: {block.hash}", className="small text-truncate"),
-                        html.Div(f"Previous Hash: {block.previous_hash}", className="small text-truncate"),
-                        html.Div(f"Nonce: {block.nonce}", className="small text-muted"),
-                        html.Hr(),
-                        html.Div(
-                            html.Pre(json.dumps(block.data, indent=2), style={"margin": 0}),
-                            style={"backgroundColor": "#f8f9fa", "padding": "8px", "borderRadius": "6px", "maxHeight": "220px", "overflow": "auto"}
-                        )
-                    ]),
-                    className="mb-3"
-                )
-                cols.append(dbc.Col(card, xs=12, md=6, lg=4))
+        for block in get_shared_chain().get_blocks_by_patient(ID):
+            card = dbc.Card(
+                dbc.CardBody([
+                    html.H6(f"🧱 Block #{block.index}", style={"marginBottom": "6px"}),
+                    html.Div(f"Timestamp: {block.timestamp}", className="small text-muted"),
+                    html.Div(f"Hash: {block.hash}", className="small text-truncate"),
+                    html.Div(f"Previous Hash: {block.previous_hash}", className="small text-truncate"),
+                    html.Div(f"Nonce: {block.nonce}", className="small text-muted"),
+                    html.Div(f"Merkle root: {block.merkle_root}", className="small text-truncate") if block.merkle_root else None,
+                    html.Hr(),
+                    html.Div(
+                        html.Pre(json.dumps(block.data, indent=2), style={"margin": 0}),
+                        style={"backgroundColor": "#f8f9fa", "padding": "8px", "borderRadius": "6px", "maxHeight": "220px", "overflow": "auto"}
+                    )
+                ]),
+                className="mb-3"
+            )
+            cols.append(dbc.Col(card, xs=12, md=6, lg=4))
 
         if not cols:
             return dbc.Alert("No blocks found for that Patient ID.", color="warning")
@@ -442,17 +525,65 @@ def register_admin_callbacks(app):
         return dbc.Row(cols, className="g-3")
 
 
-    # view the last 5 chain
+    # Page through the chain, newest blocks first; only the shown page is read
     @app.callback(
         Output("chain-container", "children", allow_duplicate=True),
+        Output("chain-page", "data"),
+        Output("chain-page-label", "children"),
         Input("view-chain-btn", "n_clicks"),
+        Input("chain-newer", "n_clicks"),
+        Input("chain-older", "n_clicks"),
+        State("chain-page", "data"),
         prevent_initial_call=True
     )
-    def update_chain(n_clicks):
-        if n_clicks == 0:
-            return []
-        chain = Blockchain().chain
-        return render_chain(chain)
+    def update_chain(n_clicks, newer_clicks, older_clicks, page):
+        trigger = dash.callback_context.triggered[0]["prop_id"].split(".")[0]
+        page = page or 0
+        if trigger == "view-chain-btn":
+            page = 0
+        elif trigger == "chain-newer":
+            page -= 1
+        elif trigger == "chain-older":
+            page += 1
+        blocks, pages = get_shared_chain().get_page(page, CHAIN_PAGE_SIZE)
+        page = min(max(0, page), pages - 1)
+        return render_chain(blocks), page, f"Page {page + 1} of {pages}"
+
+
+    # Filter choices are read from the chain whenever the View Blocks tab is
+    # opened or searched, so values committed since page load show up
+    @app.callback(
+        *[Output(input_id, "options") for input_id in FACET_INPUTS],
+        Input("admin-tabs", "active_tab"),
+        Input("view-chain-btn", "n_clicks"),
+        Input("facet-search", "n_clicks")
+    )
+    def refresh_facet_options(active_tab, view_clicks, search_clicks):
+        if active_tab != "tab-view":
+            return [dash.no_update] * len(FACET_INPUTS)
+        return [facet_options(field) for field in FACET_INPUTS.values()]
+
+
+    # Faceted record search over the chain's facet and timestamp indexes
+    @app.callback(
+        Output("chain-container", "children", allow_duplicate=True),
+        Input("facet-search", "n_clicks"),
+        *[State(input_id, "value") for input_id in FACET_INPUTS],
+        State("facet-dates", "start_date"),
+        State("facet-dates", "end_date"),
+        State("facet-match", "value"),
+        prevent_initial_call=True
+    )
+    def search_records(n_clicks, *args):
+        *picked, start_date, end_date, match = args
+        filters = {field: values or [] for field, values in zip(FACET_INPUTS.values(), picked)}
+        total, results = get_shared_chain().query_records(
+            filters, parse_picker_date(start_date), parse_picker_date(end_date, end_of_day=True),
+            match, limit=FACET_RESULT_LIMIT
+        )
+        if not total:
+            return dbc.Alert("No records match these filters.", color="warning")
+        return render_record_matches(total, results)
 
 
     # To view a specific block from cid
@@ -468,7 +599,10 @@ def register_admin_callbacks(app):
         if not re.match(r"^[a-zA-Z0-9]{46,}$", cid):
             return "❌ Invalid CID format."
 
-        return fetch_from_ipfs(cid)
+        return dbc.Row([
+            dbc.Col(render_provenance(cid), xs=12, md=4),
+            dbc.Col(fetch_from_ipfs(cid), xs=12, md=8)
+        ], className="g-3")
 
 
     # For logout (clear session and redirect to /login)
@@ -484,9 +618,11 @@ def register_admin_callbacks(app):
         return dash.no_update, dash.no_update
 
 
-    # Add data to chain
+    # Add data to chain: IPFS upload here, mining happens in the commit queue
     @app.callback(
         Output("upload-output", "children"),
+        Output("upload-ticket", "data"),
+        Output("upload-poll", "disabled"),
         Input("submit-btn", "n_clicks"),
         State("upload-data", "contents"),
         State("upload-data", "filename"),
@@ -501,70 +637,107 @@ def register_admin_callbacks(app):
         State("doctor", "value"),
         prevent_initial_call=True
     )
-    def upload_to_blockchain(n_clicks, contents, filename, patient_name, patient_id, file_type, uploader, description, disease, file_status, nex_appointment, doctor):
+    def upload_to_blockchain(n_clicks, contents, filenames, patient_name, patient_id, file_type, uploader, description, disease, file_status, nex_appointment, doctor):
         if n_clicks == 0:
-            return ""
+            return "", None, True
 
         # Check required fields (file and description are optional)
         if not (patient_id and file_type and uploader and disease and doctor):
-            return "❌ Please fill all required fields (Patient ID, File Type, Uploader, Disease, Doctor)."
-
-        # Build the metadata dictionary
-        metadata = {
-            "filename": filename if filename else "N/A",
-            "patient_id": patient_id,
-            "file_type": file_type,
-            "patient_name": patient_name,
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "description": description if description else "No description provided.",
-            "disease": disease,
-            "file-status": "Open" if file_status else "Closed",
-            "next-appointment": nex_appointment,
-            "doctor": doctor,
-            "uploaded_by": uploader,
-        }
+            return "❌ Please fill all required fields (Patient ID, File Type, Uploader, Disease, Doctor).", None, True
 
-        # If a file is uploaded, decode and embed base64
-        if contents and filename:
-            try:
-                content_type, content_string = contents.split(',')
-                decoded = base64.b64decode(content_string)
-                metadata["file_base64"] = base64.b64encode(decoded).decode('utf-8')
-            except Exception as e:
-                return f"❌ Failed to process uploaded file: {e}"
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        files = list(zip(contents, filenames)) if contents and filenames else [(None, None)]
 
-        # Save metadata to temp file and upload to IPFS
+        # Save each file's metadata to IPFS, then commit all references in one block
         try:
-            with open("temp_metadata.json", "w") as f:
-                json.dump(metadata, f)
-
             client = ipfshttpclient.connect()
-            res = client.add("temp_metadata.json")
-            cid = res['Hash']
-            os.remove("temp_metadata.json")
-
-            # Store only minimal info in blockchain
-            data = {
-                "Patient Name": patient_name,
-                "patient ID": patient_id,
-                "File Type": file_type,
-                "Disease": disease,
-                "File Status": "Open" if file_status else "Closed",
-                "cid": cid,
-                "Uploaded By": uploader,
-                "Timestamp": metadata["timestamp"]
-            }
-
-            # Add to blockchain
-            chain = Blockchain()
-            chain.add_block(data)
-
-            return f"✅ Metadata uploaded to IPFS (CID: {cid}) and reference stored in blockchain."
+            chain = get_shared_chain()
+            records = []
+            duplicates = []
+            for file_contents, filename in files:
+                # Build the metadata dictionary
+                metadata = {
+                    "filename": filename if filename else "N/A",
+                    "patient_id": patient_id,
+                    "file_type": file_type,
+                    "patient_name": patient_name,
+                    "timestamp": timestamp,
+                    "description": description if description else "No description provided.",
+                    "disease": disease,
+                    "file-status": "Open" if file_status else "Closed",
+                    "next-appointment": nex_appointment,
+                    "doctor": doctor,
+                    "uploaded_by": uploader,
+                }
+
+                # If a file is uploaded, decode and embed base64
+                if file_contents and filename:
+                    try:
+                        content_type, content_string = file_contents.split(',')
+                        decoded = base64.b64decode(content_string)
+                        metadata["file_base64"] = base64.b64encode(decoded).decode('utf-8')
+                    except Exception as e:
+                        return f"❌ Failed to process uploaded file {filename}: {e}", None, True
+
+                with open("temp_metadata.json", "w") as f:
+                    json.dump(metadata, f)
+
+                res = client.add("temp_metadata.json")
+                cid = res['Hash']
+                os.remove("temp_metadata.json")
+
+                # Identical metadata gives the same CID: don't commit it twice
+                if chain.has_cid(cid) or any(record["cid"] == cid for record in records):
+                    duplicates.append(cid)
+                    continue
+
+                # Store only minimal info in blockchain
+                records.append({
+                    "Patient Name": patient_name,
+                    "patient ID": patient_id,
+                    "File Type": file_type,
+                    "Disease": disease,
+                    "File Status": "Open" if file_status else "Closed",
+                    "cid": cid,
+                    "Uploaded By": uploader,
+                    "Timestamp": timestamp
+                })
+
+            skipped = f" Skipped, already on chain: {', '.join(duplicates)}." if duplicates else ""
+            if not records:
+                return f"⚠️ Nothing new to store.{skipped}", None, True
+
+            # Queue the whole batch for the blockchain; the poll callback reports the block
+            ticket = get_commit_queue().submit(records)
+
+            cids = ", ".join(record["cid"] for record in records)
+            return f"⏳ Metadata uploaded to IPFS (CID: {cids}); waiting for the block to be mined...{skipped}", ticket, False
 
         except Exception as e:
             if os.path.exists("temp_metadata.json"):
                 os.remove("temp_metadata.json")
-            return f"❌ Upload failed: {e}"
+            return f"❌ Upload failed: {e}", None, True
+
+
+    # Poll the commit queue until the uploaded records are on chain
+    @app.callback(
+        Output("upload-output", "children", allow_duplicate=True),
+        Output("upload-poll", "disabled", allow_duplicate=True),
+        Input("upload-poll", "n_intervals"),
+        State("upload-ticket", "data"),
+        prevent_initial_call=True
+    )
+    def poll_upload_ticket(n_intervals, ticket):
+        if not ticket:
+            return dash.no_update, True
+        status = get_commit_queue().status(ticket)
+        if status["state"] == "done":
+            return f"✅ Reference stored in blockchain (Block #{status['block_index']}).", True
+        if status["state"] == "failed":
+            return f"❌ Block commit failed: {status.get('error')}", True
+        if status["state"] == "unknown":
+            return "⚠️ Upload ticket not found; check View Blocks.", True
+        return dash.no_update, False
 
      
     @app.callback(
@@ -20,6 +20,7 @@ from admin_dashboard import layout as admin_layout
 from patient_dashboard import layout as patient_layout
 from admin_dashboard import register_admin_callbacks
 from patient_dashboard import register_patient_callbacks
+from replication import register_replication
 
 
 
@@ -84,5 +85,8 @@ register_admin_callbacks(app)
 # Patient callbacks
 register_patient_callbacks(app)
 
+# Ledger replication endpoints (and pulling from CHAIN_PEERS, if set)
+register_replication(server)
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True, port=int(os.environ.get("PORT", 8050)))
@@ -0,0 +1,165 @@
+# chain_tools.py
+# Command-line maintenance for the blockchain ledger.
+#
+#   python chain_tools.py convert blockchain.json blockchain.bin
+#   python chain_tools.py convert blockchain.bin blockchain.json
+#   python chain_tools.py audit --ledger blockchain.bin --workers 8 --resume
+#   python chain_tools.py snapshot --storage binary
+#   python chain_tools.py node-key
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from Blockchain import (
+    CHAIN_FILE, DEFAULT_STORAGE, MIN_DIFFICULTY, NODE_KEY_FILE, STORES, TRUSTED_AUTHORITIES, Block,
+    BinaryStore, Blockchain, available_cpus, block_problem, convert_chain, load_node_key, open_store,
+    public_key_hex, read_checkpoint, seal_problem, write_checkpoint,
+)
+
+
+def cmd_convert(args):
+    count = convert_chain(args.src, args.dst)
+    print(f"✅ Converted {count} blocks: {args.src} -> {args.dst}")
+    return 0
+
+
+# ---------------------
+# Audit
+# ---------------------
+# The chain is split into contiguous partitions checked in parallel. Each
+# worker verifies hashes, PoW or authority seals and links inside its partition and reports
+# the previous_hash of its first block and the hash of its last one; the
+# parent then checks the links across partition boundaries.
+
+def _audit_partition(source, start, stop, min_difficulty, authorities=frozenset()):
+    # `source` is either a list of block dicts for [start, stop) or a binary
+    # ledger path with the file offsets of those blocks, which the worker
+    # reads itself through mmap without rescanning the file
+    if isinstance(source, tuple):
+        path, offsets = source
+        store = BinaryStore(path)
+        store.offsets = offsets
+        blocks = (Block.from_dict(store.read_block(n)) for n in range(len(offsets)))
+    else:
+        blocks = (Block.from_dict(block) for block in source)
+
+    first_previous = last_hash = None
+    for position, block in enumerate(blocks, start):
+        if first_previous is None:
+            first_previous = previous_hash = block.previous_hash
+        problem = block_problem(block, position, previous_hash, min_difficulty)
+        if not problem and block.seal is not None:
+            problem = seal_problem(block, authorities)
+        if problem:
+            return {"start": start, "bad": position, "reason": problem, "first_previous": first_previous}
+        previous_hash = last_hash = block.hash
+    return {"start": start, "bad": None, "first_previous": first_previous, "last_hash": last_hash}
+
+
+def audit_chain(path, workers=None, resume=False, min_difficulty=MIN_DIFFICULTY, partitions_per_worker=4,
+                authorities=frozenset()):
+    # Returns (number of blocks checked, first broken index or None, reason)
+    workers = workers or available_cpus()
+    store = open_store(path)
+    binary = isinstance(store, BinaryStore)
+    if binary:
+        total = store.scan()
+        block_hash = lambda n: store.read_header(n)["hash"]
+    else:
+        blocks = store.load()
+        total = len(blocks)
+        block_hash = lambda n: blocks[n]["hash"]
+
+    start = 0
+    if resume:
+        checkpoint = read_checkpoint(path)
+        if checkpoint and checkpoint[0] < total and block_hash(checkpoint[0]) == checkpoint[1]:
+            start = checkpoint[0] + 1
+    if start >= total:
+        return 0, None, None
+
+    size = max(1, -(-(total - start) // (workers * partitions_per_worker)))
+    ranges = [(lo, min(lo + size, total)) for lo in range(start, total, size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_audit_partition, (path, store.offsets[lo:hi]) if binary else blocks[lo:hi], lo, hi,
+                        min_difficulty, authorities)
+            for lo, hi in ranges
+        ]
+        results = [future.result() for future in futures]
+
+    previous_hash = block_hash(start - 1) if start else None
+    for result in results:
+        if result["start"] and result["first_previous"] != previous_hash:
+            return result["start"] - start, result["start"], "previous_hash does not match the prior block"
+        if result["bad"] is not None:
+            return result["bad"] - start, result["bad"], result["reason"]
+        previous_hash = result["last_hash"]
+
+    write_checkpoint(path, total - 1, previous_hash)
+    return total - start, None, None
+
+
+def cmd_audit(args):
+    # sealed blocks are accepted from --authority keys, TRUSTED_AUTHORITIES and this node's key
+    authorities = set(args.authority) | set(TRUSTED_AUTHORITIES)
+    if os.path.exists(NODE_KEY_FILE):
+        authorities.add(public_key_hex(load_node_key()))
+    checked, bad, reason = audit_chain(args.ledger, args.workers, args.resume, args.min_difficulty,
+                                       authorities=frozenset(authorities))
+    if bad is not None:
+        print(f"❌ Audit failed: block #{bad}: {reason}")
+        return 1
+    print(f"✅ Audit passed: {checked} blocks verified.")
+    return 0
+
+
+def cmd_snapshot(args):
+    path = Blockchain(storage=args.storage).write_snapshot()
+    print(f"📸 Snapshot written: {path}")
+    return 0
+
+
+def cmd_node_key(args):
+    # the public key other nodes list as a trusted authority
+    print(public_key_hex(load_node_key(args.path)))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Blockchain ledger tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    convert = sub.add_parser("convert", help="Convert between .json, .jsonl and .bin ledger formats")
+    convert.add_argument("src")
+    convert.add_argument("dst")
+    convert.set_defaults(func=cmd_convert)
+
+    audit = sub.add_parser("audit", help="Re-verify every block's hash, PoW target and previous_hash link")
+    audit.add_argument("--ledger", default=CHAIN_FILE)
+    audit.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    audit.add_argument("--resume", action="store_true", help="start after the last verified checkpoint")
+    # each block is checked at the target it records; this only sets the floor
+    audit.add_argument("--min-difficulty", type=int, default=MIN_DIFFICULTY)
+    audit.add_argument("--authority", action="append", default=[], help="trusted signer public key (hex)")
+    audit.set_defaults(func=cmd_audit)
+
+    snapshot = sub.add_parser("snapshot", help="Write an index snapshot (binary storage also resumes its headers from it)")
+    snapshot.add_argument("--storage", choices=sorted(STORES), default=DEFAULT_STORAGE)
+    snapshot.set_defaults(func=cmd_snapshot)
+
+    node_key = sub.add_parser("node-key", help="Print this node's public key (created on first use)")
+    node_key.add_argument("--path", default=NODE_KEY_FILE)
+    node_key.set_defaults(func=cmd_node_key)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
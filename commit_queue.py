@@ -0,0 +1,170 @@
+# commit_queue.py
+# Background block commits: the upload callback enqueues its records and
+# gets a ticket back at once; a worker thread mines and persists them and
+# the admin UI polls the ticket. Jobs that queue up while a block is being
+# mined are committed together in the next block.
+#
+# Jobs and tickets are kept in "<ledger>.queue" under a FileLock, so any
+# server process can answer a poll and uploads accepted before a restart are
+# still committed. A job stays in the file until its block is on chain; one
+# claimed longer than JOB_CLAIM_TIMEOUT ago is taken over by the next worker,
+# minus any records whose CID already reached the chain.
+import json
+import os
+import threading
+import time
+import uuid
+
+from Blockchain import FileLock, get_shared_chain
+
+MAX_BATCH_RECORDS = 500  # upper bound on records coalesced into one block
+TICKET_HISTORY = 1000  # finished tickets remembered for polling
+JOB_CLAIM_TIMEOUT = 300  # seconds before a claimed job counts as abandoned
+
+
+class CommitQueue:
+    def __init__(self, chain_factory=get_shared_chain, path=None):
+        self.chain_factory = chain_factory
+        self._path = path
+        self._lock = threading.Lock()
+        self._worker = None
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = self.chain_factory().store.path + ".queue"
+        return self._path
+
+    def submit(self, records):
+        records = list(records)
+        if not records:
+            raise ValueError("Nothing to commit")
+        ticket = uuid.uuid4().hex
+        with FileLock(self.path):
+            state = self._read()
+            state["jobs"].append({"ticket": ticket, "records": records, "claimed_at": None})
+            state["tickets"][ticket] = {"state": "queued", "records": len(records)}
+            self._write(state)
+        self._ensure_worker()
+        return ticket
+
+    def status(self, ticket):
+        status = self._read()["tickets"].get(ticket)
+        if status is None:
+            return {"state": "unknown"}
+        if status["state"] in ("queued", "mining"):
+            self._ensure_worker()  # picks up jobs left behind by a restart
+        return status
+
+    def pending(self):
+        return len(self._read()["jobs"])
+
+    def _read(self):
+        # the file is only ever replaced whole, so reading needs no lock
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"jobs": [], "tickets": {}}
+
+    def _write(self, state):
+        tickets = state["tickets"]
+        finished = [t for t, s in tickets.items() if s["state"] in ("done", "failed")]
+        for ticket in finished[:max(0, len(tickets) - TICKET_HISTORY)]:
+            del tickets[ticket]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="commit-queue", daemon=True)
+                self._worker.start()
+
+    def _claim(self):
+        # the oldest unclaimed (or abandoned) jobs, up to MAX_BATCH_RECORDS
+        now = time.time()
+        jobs, count = [], 0
+        with FileLock(self.path):
+            state = self._read()
+            for job in state["jobs"]:
+                if count >= MAX_BATCH_RECORDS:
+                    break
+                claimed_at = job["claimed_at"]
+                if claimed_at is not None and now - claimed_at < JOB_CLAIM_TIMEOUT:
+                    continue
+                jobs.append(dict(job, abandoned=claimed_at is not None))
+                count += len(job["records"])
+                job["claimed_at"] = now
+                state["tickets"][job["ticket"]]["state"] = "mining"
+            if jobs:
+                self._write(state)
+        return jobs
+
+    def _finish(self, tickets, **fields):
+        tickets = set(tickets)
+        with FileLock(self.path):
+            state = self._read()
+            state["jobs"] = [job for job in state["jobs"] if job["ticket"] not in tickets]
+            for ticket in tickets:
+                state["tickets"][ticket] = dict(state["tickets"].get(ticket, {}), **fields)
+            self._write(state)
+
+    def _run(self):
+        while True:
+            jobs = self._claim()
+            if not jobs:
+                with self._lock:
+                    # a job submitted before this check is claimed here; one
+                    # submitted after it starts a new worker
+                    jobs = self._claim()
+                    if not jobs:
+                        self._worker = None
+                        return
+            self._commit(jobs)
+
+    def _commit(self, jobs):
+        pending = [job["ticket"] for job in jobs]
+        try:
+            chain = self.chain_factory()
+            tickets, records = [], []
+            for job in jobs:
+                committed = self._committed_block(chain, job) if job["abandoned"] else None
+                if committed is not None:
+                    self._finish([job["ticket"]], state="done", block_index=committed.index, block_hash=committed.hash)
+                    pending.remove(job["ticket"])
+                    continue
+                tickets.append(job["ticket"])
+                records.extend(job["records"])
+            if records:
+                block = chain.add_records(records)
+                self._finish(tickets, state="done", block_index=block.index, block_hash=block.hash)
+        except Exception as e:
+            self._finish(pending, state="failed", error=str(e))
+
+    @staticmethod
+    def _committed_block(chain, job):
+        # the block holding an abandoned job, if its worker got that far
+        cids = [record.get("cid") for record in job["records"]]
+        if not cids or None in cids:
+            return None
+        found = [chain.get_records_by_cid(cid) for cid in cids]
+        if not all(found):
+            return None
+        return found[0][0][0]
+
+
+_commit_queue = None
+_commit_queue_lock = threading.Lock()
+
+
+def get_commit_queue():
+    global _commit_queue
+    with _commit_queue_lock:
+        if _commit_queue is None:
+            _commit_queue = CommitQueue()
+        return _commit_queue
@@ -8,8 +8,9 @@ import dash_bootstrap_components as dbc
 from datetime import datetime
 import ipfshttpclient
 
+from Blockchain import get_shared_chain, read_checkpoint, verify_record_proof
+
 # Files
-BLOCKCHAIN_FILE = "blockchain.json"
 USERS_FILE = "users.json"
 
 
@@ -22,13 +23,9 @@ USERS_FILE = "users.json"
 # ---------------- Helper Functions ----------------
 def load_blockchain():
     try:
-        with open(BLOCKCHAIN_FILE, "r") as f:
-            data = json.load(f)
-            if isinstance(data, list):
-                return data
+        return get_shared_chain()
     except Exception:
-        pass
-    return []
+        return None
 
 
 def fetch_from_ipfs(cid):
@@ -98,33 +95,79 @@ def fetch_from_ipfs(cid):
         return html.Div(f"❌ IPFS Error: {e}", style={"color": "red"})
 
 
-def get_patient_records(patient_id):
+# ledger path -> (checkpoint hash, {(block index, record position)} proven under it)
+_proven = {}
+
+
+def verified_records(chain, matches):
+    # {(block index, record position)} of the matches committed in blocks at
+    # or below the verified checkpoint. chain.verify() has just hashed and
+    # linked every block up to it (resuming from the previous checkpoint, so
+    # only new blocks cost anything), which leaves only each record's Merkle
+    # path (or data) against its own block header to check. Results are kept
+    # for as long as the checkpoint stays the same.
+    with chain.lock:
+        if not chain.verify()[0]:
+            return set()
+        checkpoint = read_checkpoint(chain.store.path)
+        if checkpoint is None:
+            return set()
+        height, checkpoint_hash = checkpoint
+        if height >= len(chain.chain) or chain.chain[height].hash != checkpoint_hash:
+            return set()  # moved by another process since; check again on the next load
+        cached_hash, proven = _proven.get(chain.store.path, (None, set()))
+        if cached_hash != checkpoint_hash:
+            proven = set()
+            _proven[chain.store.path] = (checkpoint_hash, proven)
+        verified = set()
+        for block, record_pos, _ in matches:
+            key = (block.index, record_pos)
+            if key not in proven and block.index <= height:
+                proof = chain.get_record_proof(block.index, record_pos)
+                if verify_record_proof(proof, trusted_hash=chain.chain[block.index].hash,
+                                       min_difficulty=chain.min_difficulty,
+                                       authorities=chain.consensus.authorities):
+                    proven.add(key)
+            if key in proven:
+                verified.add(key)
+        return verified
+
+
+def get_patient_records(patient_id, start=None, end=None):
+    # Newest first; start/end (inclusive datetimes) are answered by the
+    # chain's timestamp index, so no timestamps are parsed here
     chain = load_blockchain()
+    if chain is None:
+        return []
+    matches = chain.get_records_by_time(patient_id, start, end)
+    verified = verified_records(chain, matches)
     records = []
-    for block in chain:
-        if not isinstance(block, dict):
-            continue
-        data = block.get("data", {})
-        if isinstance(data, dict) and data.get("patient ID") == patient_id:
-            records.append({
-                "cid": data.get("cid", "N/A"),
-                "file_type": data.get("File Type", ""),
-                "uploaded_by": data.get("Uploaded By", ""),
-                "disease": data.get("Disease", ""),
-                "timestamp": block.get("timestamp", ""),
-                "file_status": data.get("File Status", ""),
-                "block_index": block.get("index", -1)
-            })
-
-    def _ts_key(r):
-        try:
-            return datetime.strptime(r.get("timestamp", "").split(".")[0], "%Y-%m-%d %H:%M:%S")
-        except Exception:
-            return datetime.min
-    records.sort(key=_ts_key, reverse=True)
+    for block, record_pos, data in reversed(matches):
+        records.append({
+            "cid": data.get("cid", "N/A"),
+            "file_type": data.get("File Type", ""),
+            "uploaded_by": data.get("Uploaded By", ""),
+            "disease": data.get("Disease", ""),
+            "timestamp": block.timestamp,
+            "file_status": data.get("File Status", ""),
+            "block_index": block.index,
+            "record_pos": record_pos,
+            "verified": (block.index, record_pos) in verified
+        })
     return records
 
 
+def parse_picker_date(value, end_of_day=False):
+    # DatePickerRange value ("YYYY-MM-DD" or ISO datetime) -> datetime, None if unset or invalid
+    if not value:
+        return None
+    try:
+        day = datetime.strptime(value.split("T")[0], "%Y-%m-%d")
+    except ValueError:
+        return None
+    return day.replace(hour=23, minute=59, second=59) if end_of_day else day
+
+
 def get_patient_id_from_username(username):
     try:
         if not os.path.exists(USERS_FILE):
@@ -247,49 +290,21 @@ def register_patient_callbacks(app):
         if not patient_id:
             return dbc.Alert("❌ Patient ID not found for this user.", color="danger")
 
-        records = get_patient_records(patient_id)
-        if not records:
+        chain = load_blockchain()
+        if chain is None or not chain.count_records_by_patient(patient_id):
             return dbc.Alert("⚠️ No records found for this patient.", color="warning")
 
-        def in_range(record_ts):
-            if not (start_date or end_date):
-                return True
-            if not record_ts:
-                return True
-            try:
-                date_part = record_ts.split()[0]
-                rec_date = datetime.strptime(date_part, "%Y-%m-%d").date()
-            except Exception:
-                return True
-
-            if start_date:
-                try:
-                    s = datetime.strptime(start_date.split("T")[0], "%Y-%m-%d").date()
-                except Exception:
-                    s = None
-            else:
-                s = None
-            if end_date:
-                try:
-                    e = datetime.strptime(end_date.split("T")[0], "%Y-%m-%d").date()
-                except Exception:
-                    e = None
-            else:
-                e = None
-
-            if s and rec_date < s:
-                return False
-            if e and rec_date > e:
-                return False
-            return True
-
-        filtered = [r for r in records if in_range(r.get("timestamp"))]
+        # The range is parsed once; records are picked from the timestamp index
+        filtered = get_patient_records(patient_id, parse_picker_date(start_date), parse_picker_date(end_date, end_of_day=True))
         if not filtered:
             return dbc.Alert("⚠️ No records found in the selected date range.", color="warning")
 
         cols = []
         for record in filtered:
-            header = dbc.CardHeader(f"📦 Block #{record['block_index']} — {record['timestamp']}")
+            header = dbc.CardHeader([
+                f"📦 Block #{record['block_index']} — {record['timestamp']} ",
+                dbc.Badge("🔐 Verified", color="success") if record["verified"] else dbc.Badge("⚠️ Unverified", color="danger")
+            ])
             body = dbc.CardBody([
                 dbc.Row([
                     dbc.Col(html.Div([html.Strong("File Type:"), html.Div(record["file_type"])]), xs=12, md=6),
@@ -0,0 +1,161 @@
+# replication.py
+# Pull-based chain replication between app instances. Every node serves its
+# ledger on the Flask server; a follower asks each peer for the blocks after
+# its own tip (height and hash), validates the batch and appends it through
+# Blockchain.append_blocks, the same locked append local commits use. A node
+# only ever extends its chain: if a peer does not have our tip, the chains
+# have diverged and sync from that peer stops with an error.
+#
+# Replication is off unless CHAIN_REPLICATION_TOKEN is set: the ledger holds
+# patient data, and the endpoints bypass the dashboard login. Two local
+# instances over loopback, each in its own directory:
+#   cd site-a && CHAIN_REPLICATION_TOKEN=s3cret PORT=8050 python ../app.py
+#   cd site-b && CHAIN_REPLICATION_TOKEN=s3cret PORT=8051 CHAIN_PEERS=http://127.0.0.1:8050 python ../app.py
+import hmac
+import json
+import multiprocessing
+import os
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from flask import Response, abort, request
+
+from Blockchain import Block, get_shared_chain, loads_record
+
+REPLICATION_PEERS = [peer.rstrip("/") for peer in os.environ.get("CHAIN_PEERS", "").split(",") if peer.strip()]
+# Shared secret sent as X-Replication-Token; without one nothing is served or pulled
+REPLICATION_TOKEN = os.environ.get("CHAIN_REPLICATION_TOKEN")
+REPLICATION_BATCH = 500  # blocks per request
+SYNC_INTERVAL = 5  # seconds between pulls from each peer
+PEER_TIMEOUT = 10
+
+
+class ReplicationError(Exception):
+    pass
+
+
+def _authorize(token):
+    # remote_addr is no guard: behind a local reverse proxy every client is 127.0.0.1
+    sent = request.headers.get("X-Replication-Token", "")
+    if not hmac.compare_digest(sent.encode(), token.encode()):
+        abort(403)
+
+
+def register_replication(server, chain_factory=get_shared_chain, peers=None, token=None):
+    # Serve our ledger to peers and, if any are configured, pull from them.
+    # Does nothing without a replication token.
+    token = token or REPLICATION_TOKEN
+    if not token:
+        if peers or REPLICATION_PEERS:
+            print("⚠️ CHAIN_PEERS is set but CHAIN_REPLICATION_TOKEN is not; replication is off.")
+        return
+
+    @server.route("/replication/tip")
+    def replication_tip():
+        _authorize(token)
+        tip = chain_factory().get_latest_block()
+        return {"height": tip.index, "hash": tip.hash}
+
+    @server.route("/replication/blocks")
+    def replication_blocks():
+        # Blocks after ?after=<height> as a JSON array, if our block at that
+        # height has ?hash=; 409 otherwise (the requester is on another fork).
+        # after=-1 sends the chain from genesis.
+        _authorize(token)
+        chain = chain_factory()
+        try:
+            after = int(request.args["after"])
+            limit = min(int(request.args.get("limit", REPLICATION_BATCH)), REPLICATION_BATCH)
+        except (KeyError, ValueError):
+            abort(400)
+        with chain.lock:
+            if after < -1:
+                abort(400)
+            if 0 <= after < len(chain.chain) and chain.chain[after].hash != request.args.get("hash"):
+                return {"error": "unknown tip", "height": len(chain.chain) - 1}, 409
+            # stored records are spliced in as-is rather than re-encoded
+            records = [block.encode_record() for block in chain.get_block_range(after + 1, after + 1 + limit)]
+        return Response(b"[" + b",".join(records) + b"]", mimetype="application/json")
+
+    peers = REPLICATION_PEERS if peers is None else peers
+    # not in helper processes (e.g. mining workers) that re-import the app
+    if peers and multiprocessing.parent_process() is None:
+        start_replication(peers, chain_factory, token=token)
+
+
+def _get(url, token):
+    with urlopen(Request(url, headers={"X-Replication-Token": token}), timeout=PEER_TIMEOUT) as reply:
+        return reply.read()
+
+
+def _fetch_blocks(peer, after, block_hash, batch, token):
+    query = urlencode({"after": after, "hash": block_hash, "limit": batch})
+    return [Block.from_dict(block) for block in loads_record(_get(f"{peer}/replication/blocks?{query}", token))]
+
+
+def pull_from_peer(peer, chain=None, batch=REPLICATION_BATCH, token=None):
+    # Append every block the peer has past our tip; returns how many
+    chain = chain or get_shared_chain()
+    token = token or REPLICATION_TOKEN
+    if not token:
+        raise ReplicationError("No replication token (CHAIN_REPLICATION_TOKEN) to send to peers")
+    pulled = 0
+    while True:
+        tip = chain.refresh().get_latest_block()
+        try:
+            blocks = _fetch_blocks(peer, tip.index, tip.hash, batch, token)
+        except HTTPError as e:
+            if e.code != 409:
+                raise
+            if len(chain.chain) > 1:
+                raise ReplicationError(f"{peer} does not have our block #{tip.index}; the chains have diverged")
+            # a fresh replica: take the peer's chain from its genesis block
+            blocks = _fetch_blocks(peer, -1, "", batch, token)
+            try:
+                pulled += chain.adopt_chain(blocks)
+            except ValueError as e:
+                raise ReplicationError(f"Rejected chain from {peer}: {e}")
+            print(f"📥 Adopted the chain of {peer}.")
+            if len(blocks) < batch:
+                return pulled
+            continue
+        try:
+            pulled += chain.append_blocks(blocks)
+        except ValueError as e:
+            raise ReplicationError(f"Rejected blocks from {peer}: {e}")
+        if len(blocks) < batch:
+            return pulled
+
+
+def peer_tip(peer, token=None):
+    return json.loads(_get(f"{peer}/replication/tip", token or REPLICATION_TOKEN))
+
+
+_replicator = None
+_replicator_lock = threading.Lock()
+
+
+def start_replication(peers, chain_factory=get_shared_chain, interval=SYNC_INTERVAL, token=None):
+    # One background puller per process
+    global _replicator
+    with _replicator_lock:
+        if _replicator is not None and _replicator.is_alive():
+            return _replicator
+
+        def run():
+            while True:
+                for peer in peers:
+                    try:
+                        pulled = pull_from_peer(peer, chain_factory(), token=token)
+                        if pulled:
+                            print(f"🔄 Replicated {pulled} blocks from {peer}.")
+                    except Exception as e:  # a bad reply must not stop the puller
+                        print(f"⚠️ Replication from {peer} failed: {e!r}")
+                time.sleep(interval)
+
+        _replicator = threading.Thread(target=run, name="chain-replication", daemon=True)
+        _replicator.start()
+        return _replicator
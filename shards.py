@@ -0,0 +1,178 @@
+# shards.py
+# Sharded ledger: records are routed to one of several independent chains
+# (per department, patient-ID range, ...), each with its own file and write
+# lock, so writers to different shards never wait on each other. Every
+# ANCHOR_INTERVAL blocks a shard's tip (height and hash) is committed to a
+# root chain, which ties the shards together: rewriting a shard's history
+# below an anchor no longer matches the root.
+import bisect
+import os
+import threading
+import zlib
+from datetime import datetime
+
+from Blockchain import DEFAULT_STORAGE, STORE_FILES, Blockchain
+
+ANCHOR_INTERVAL = 100  # shard blocks between anchors of its tip in the root chain
+ROOT_SHARD = "root"
+
+
+def shard_path(storage, name):
+    # blockchain.json -> blockchain.shard-<name>.json, blockchain.root.json
+    base, ext = os.path.splitext(STORE_FILES[storage])
+    return f"{base}.root{ext}" if name == ROOT_SHARD else f"{base}.shard-{name}{ext}"
+
+
+# --- Routers ---
+# A router names the shard of each record and the shards that can hold a
+# given patient's records, so patient queries only read those.
+
+class PatientHashRouter:
+    # Spread patients evenly: shard = crc32(patient ID) mod the shard count
+    def __init__(self, names):
+        self.names = list(names)
+
+    def shard_for(self, record):
+        return self.shards_for_patient(record.get("patient ID"))[0]
+
+    def shards_for_patient(self, patient_id):
+        return [self.names[zlib.crc32(str(patient_id).encode()) % len(self.names)]]
+
+
+class PatientRangeRouter:
+    # Numeric patient-ID ranges: bounds [1000, 2000] sends IDs below 1000 to
+    # names[0], below 2000 to names[1] and the rest to names[2]
+    def __init__(self, bounds, names):
+        if len(names) != len(bounds) + 1:
+            raise ValueError("PatientRangeRouter needs one more shard name than bounds")
+        self.bounds = sorted(bounds)
+        self.names = list(names)
+
+    def shard_for(self, record):
+        return self.shards_for_patient(record.get("patient ID"))[0]
+
+    def shards_for_patient(self, patient_id):
+        try:
+            key = int(patient_id)
+        except (TypeError, ValueError):
+            raise ValueError(f"Patient ID {patient_id!r} is not numeric; can't pick a range shard")
+        return [self.names[bisect.bisect_right(self.bounds, key)]]
+
+
+class FieldRouter:
+    # Department-style sharding on a record field, e.g.
+    # FieldRouter("File Type", {"MRI": "radiology", "X-Ray": "radiology"}, "general").
+    # A patient's records may be in any shard.
+    def __init__(self, field, mapping, default):
+        self.field = field
+        self.mapping = dict(mapping)
+        self.default = default
+        self.names = sorted(set(self.mapping.values()) | {default})
+
+    def shard_for(self, record):
+        return self.mapping.get(record.get(self.field), self.default)
+
+    def shards_for_patient(self, patient_id):
+        return self.names
+
+
+class ShardedChain:
+    def __init__(self, router, storage=None, durability=None, consensus=None, block_format=None):
+        self.router = router
+        self.storage = storage or DEFAULT_STORAGE
+        options = dict(storage=self.storage, durability=durability, consensus=consensus, block_format=block_format)
+        self.shards = {name: Blockchain(path=shard_path(self.storage, name), **options) for name in router.names}
+        self.root = Blockchain(path=shard_path(self.storage, ROOT_SHARD), **options)
+        self._anchor_lock = threading.Lock()
+        self.anchored = {name: 0 for name in self.shards}  # highest height anchored per shard
+        for _, record in self._anchors():
+            if record["shard"] in self.anchored:
+                self.anchored[record["shard"]] = max(self.anchored[record["shard"]], record["height"])
+
+    def shard(self, name):
+        return self.shards[name]
+
+    def add_records(self, records):
+        # Commit records to their shards, one block per shard involved.
+        # Returns {shard name: block}.
+        groups = {}
+        for record in records:
+            groups.setdefault(self.router.shard_for(record), []).append(record)
+        blocks = {}
+        for name, group in groups.items():
+            blocks[name] = self.shards[name].add_records(group)
+            self._anchor_if_due(name, blocks[name])
+        return blocks
+
+    def add_block(self, data):
+        name = self.router.shard_for(data)
+        block = self.shards[name].add_block(data)
+        self._anchor_if_due(name, block)
+        return block
+
+    def _anchor_if_due(self, name, block):
+        if block.index - self.anchored[name] >= ANCHOR_INTERVAL:
+            self.anchor([name])
+
+    def anchor(self, names=None):
+        # Commit the current tips of `names` (default: every shard with
+        # unanchored blocks) to the root chain as one block
+        with self._anchor_lock:
+            anchors = []
+            for name in names or self.shards:
+                tip = self.shards[name].refresh().get_latest_block()
+                if tip.index > self.anchored[name]:
+                    anchors.append({
+                        "shard": name,
+                        "height": tip.index,
+                        "hash": tip.hash,
+                        "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    })
+            if not anchors:
+                return None
+            block = self.root.add_records(anchors)
+            for anchor in anchors:
+                self.anchored[anchor["shard"]] = anchor["height"]
+            return block
+
+    def _anchors(self):
+        # (root block index, anchor record) for every anchor in the root chain
+        for block in self.root.refresh().chain[1:]:
+            for record in block.records():
+                if "shard" in record:
+                    yield block.index, record
+
+    def get_records_by_patient(self, patient_id):
+        # [(shard name, block, record position, record)]
+        return [
+            (name, block, record_pos, record)
+            for name in self.router.shards_for_patient(patient_id)
+            for block, record_pos, record in self.shards[name].get_records_by_patient(patient_id)
+        ]
+
+    def get_blocks_by_patient(self, patient_id):
+        # [(shard name, block)]
+        return [
+            (name, block)
+            for name in self.router.shards_for_patient(patient_id)
+            for block in self.shards[name].get_blocks_by_patient(patient_id)
+        ]
+
+    def verify(self, full=False):
+        # Returns (True, None) or (False, (shard name, index of the first
+        # invalid block)). Anchors are checked against the shards after
+        # each chain is valid on its own.
+        for name, chain in [(ROOT_SHARD, self.root), *self.shards.items()]:
+            ok, position = chain.verify(full)
+            if not ok:
+                return False, (name, position)
+        for root_index, anchor in self._anchors():
+            chain = self.shards.get(anchor["shard"])
+            if chain is None:
+                continue
+            if anchor["height"] >= len(chain.chain) or chain.chain[anchor["height"]].hash != anchor["hash"]:
+                return False, (anchor["shard"], min(anchor["height"], len(chain.chain)))
+        return True, None
+
+    def is_valid(self, full=False):
+        return self.verify(full)[0]
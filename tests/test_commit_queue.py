@@ -0,0 +1,57 @@
+# The commit queue keeps its jobs and tickets next to the ledger: a ticket
+# submitted through one server process can be polled through another, and
+# jobs accepted before a restart are still committed.
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Blockchain import Blockchain  # noqa: E402
+from commit_queue import CommitQueue  # noqa: E402
+
+
+def _wait_done(commit_queue, ticket, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = commit_queue.status(ticket)
+        if status["state"] in ("done", "failed"):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"ticket {ticket} still {status['state']}")
+
+
+def test_ticket_visible_to_other_queue(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chain = Blockchain(storage="log")
+    submitter = CommitQueue(lambda: chain.refresh())
+    poller = CommitQueue(lambda: chain.refresh())
+
+    ticket = submitter.submit([{"patient ID": "P1", "cid": "cid-1"}])
+    status = _wait_done(poller, ticket)
+
+    assert status["state"] == "done"
+    assert chain.refresh().chain[status["block_index"]].hash == status["block_hash"]
+
+
+def test_jobs_survive_restart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chain = Blockchain(storage="log")
+    path = chain.store.path + ".queue"
+    # one job never claimed, one claimed by a process that died after committing it
+    committed = chain.add_records([{"patient ID": "P2", "cid": "cid-2"}])
+    with open(path, "w") as f:
+        json.dump({
+            "jobs": [
+                {"ticket": "a", "records": [{"patient ID": "P1", "cid": "cid-1"}], "claimed_at": None},
+                {"ticket": "b", "records": [{"patient ID": "P2", "cid": "cid-2"}], "claimed_at": 0},
+            ],
+            "tickets": {"a": {"state": "queued", "records": 1}, "b": {"state": "mining", "records": 1}},
+        }, f)
+
+    restarted = CommitQueue(lambda: chain.refresh())
+    assert _wait_done(restarted, "a")["state"] == "done"
+    assert _wait_done(restarted, "b")["block_index"] == committed.index
+    assert restarted.pending() == 0
+    assert len(chain.refresh().get_records_by_cid("cid-2")) == 1
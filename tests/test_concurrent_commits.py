@@ -0,0 +1,44 @@
+# Several processes committing to one ledger at once: every block must land
+# exactly once on a single valid chain (no lost updates, no forks).
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Blockchain import Blockchain  # noqa: E402
+
+PROCESSES = 4
+BLOCKS_PER_PROCESS = 40
+
+
+def _writer(directory, storage, writer_id, count):
+    os.chdir(directory)
+    chain = Blockchain(storage=storage)
+    for n in range(count):
+        chain.add_block({"patient ID": f"P{writer_id}", "CID": f"cid-{writer_id}-{n}"})
+
+
+@pytest.mark.parametrize("storage", ["json", "log", "binary"])
+def test_concurrent_writers_lose_no_blocks(tmp_path, monkeypatch, storage):
+    monkeypatch.chdir(tmp_path)
+    Blockchain(storage=storage)  # create the ledger up front
+
+    ctx = multiprocessing.get_context("spawn")
+    writers = [
+        ctx.Process(target=_writer, args=(str(tmp_path), storage, writer_id, BLOCKS_PER_PROCESS))
+        for writer_id in range(PROCESSES)
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert [writer.exitcode for writer in writers] == [0] * PROCESSES
+
+    chain = Blockchain(storage=storage)
+    assert len(chain.chain) == 1 + PROCESSES * BLOCKS_PER_PROCESS
+    assert chain.is_valid(full=True)
+    cids = {record["CID"] for block in chain.chain[1:] for record in block.records()}
+    assert cids == {f"cid-{w}-{n}" for w in range(PROCESSES) for n in range(BLOCKS_PER_PROCESS)}
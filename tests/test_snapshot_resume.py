@@ -0,0 +1,53 @@
+# A binary-storage snapshot carries the header columns and the store's
+# offset table: a restart resumes from it, reads only the blocks written
+# after it and ends up with the same chain as a full scan.
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Blockchain import Blockchain  # noqa: E402
+
+
+def _headers(chain):
+    return [block.header_dict() for block in chain.chain]
+
+
+def test_restart_resumes_from_snapshot(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    chain = Blockchain(storage="binary")
+    for n in range(5):
+        chain.add_records([{"patient ID": f"P{n % 2}", "cid": f"cid-{n}"}])
+    chain.write_snapshot()
+    for n in range(5, 8):
+        chain.add_block({"patient ID": "P2", "cid": f"cid-{n}"})
+
+    capsys.readouterr()
+    resumed = Blockchain(storage="binary")
+    assert "resumed from snapshot at block #5" in capsys.readouterr().out
+    assert len(resumed.chain) == 9
+    assert resumed.is_valid(full=True)
+    assert resumed.has_cid("cid-7") and len(resumed.get_records_by_patient("P1")) == 2
+
+    for path in glob.glob(f"{chain.store.path}.snapshot.*"):
+        os.remove(path)
+    scanned = Blockchain(storage="binary")
+    assert _headers(resumed) == _headers(scanned)
+    assert [block.records() for block in resumed.chain] == [block.records() for block in scanned.chain]
+
+
+def test_snapshot_of_rewritten_ledger_is_ignored(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    chain = Blockchain(storage="binary")
+    for n in range(3):
+        chain.add_block({"patient ID": "P1", "cid": f"cid-{n}"})
+    chain.write_snapshot()
+    rewrite = Blockchain(storage="binary", lazy=False)
+    rewrite.chain = rewrite.chain[:2]
+    rewrite.save_chain()
+
+    capsys.readouterr()
+    reloaded = Blockchain(storage="binary")
+    assert "resumed from snapshot" not in capsys.readouterr().out
+    assert len(reloaded.chain) == 2 and reloaded.is_valid(full=True)